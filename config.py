@@ -3,6 +3,8 @@
 # -- Telegram Bot 配置 --
 BOT_TOKEN = "123:abc"  # 替换为你的 Bot Token
 ALLOWED_USER_ID = 123456  # 替换为你的 Telegram User ID，只有此用户可以与Bot交互
+TELEGRAM_HTTP_VERSION = "1.1"  # 与 Telegram API 通信的 HTTP 版本："1.1" 或 "2"
+                              # 直连环境可设为 "2"，并发发送时复用同一连接；使用代理时如遇TLS握手错误请保持 "1.1"
 
 # -- 文件路径配置 --
 IMAGE_DOWNLOAD_PATH = "./downloads"  # Bot下载和索引图片的文件夹
@@ -18,6 +20,9 @@ OCR_MAX_RETRIES = 3           # OCR失败后最多重试次数
 OCR_BATCH_SIZE = 5           # 单次处理的最大图片数量（内存优化，不影响总处理数）
                               # 说明：定时任务会循环调用，直到所有待处理图片都完成
                               # 例如：如果有 25 张待处理，会分 3 次处理（10+10+5）
+OCR_RETRY_BASE_INTERVAL = 600  # 定时任务中失败图片重试的基础退避间隔（秒）
+                              # 第 n 次失败后需等待 600 * 2^(n-1) 秒才会重试，避免同一次任务中反复处理无法识别的图片
+                              # 设置为 0 则不退避
 
 # -- Mac 快捷指令 OCR 配置 --
 MAC_SHORTCUTS = "ocr-file"    # Mac 快捷指令名称，用于调用系统 OCR
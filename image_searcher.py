@@ -1,7 +1,8 @@
 import os
 import sqlite3
 import hashlib
-from typing import List, Dict, Optional, Tuple
+import io
+from typing import List, Dict, Iterator, Optional, Tuple
 import time
 import logging
 import re
@@ -31,6 +32,22 @@ if not MAC_SHORTCUTS or platform.system() != 'Darwin':
 else:
     PaddleOCR = None
 
+# 待OCR图片的筛选条件：pending，或失败次数未达上限且距上次失败已超过退避时间
+# （退避时间 = 基础间隔 * 2^(失败次数-1)），参数依次为 (max_retries, 当前时间, 基础间隔)
+PENDING_OCR_CONDITION = """(ocr_status = 'pending' OR (
+    ocr_status = 'failed' AND ocr_fail_count < ?
+    AND ? - COALESCE(ocr_last_attempt, 0) >= ? * (1 << MAX(ocr_fail_count - 1, 0))
+))"""
+
+# get_failed_ocr_records 允许查询的列
+FAILED_OCR_RECORD_COLUMNS = ('id', 'file_path', 'telegram_message_id', 'ocr_fail_count', 'updated_time')
+# get_failed_ocr_records 可额外查询的计算列：由 SQLite 直接计算，例如去掉目录部分的文件名
+_NORMALIZED_PATH_SQL = "REPLACE(file_path, '\\', '/')"
+FAILED_OCR_COMPUTED_COLUMNS = {
+    'file_name': f"SUBSTR({_NORMALIZED_PATH_SQL}, LENGTH(RTRIM({_NORMALIZED_PATH_SQL}, REPLACE({_NORMALIZED_PATH_SQL}, '/', ''))) + 1)",
+}
+
+
 class ImageSimilaritySearcher:
     """图像相似性搜索器 - Bot专用版"""
 
@@ -286,12 +303,18 @@ class ImageSimilaritySearcher:
                 telegram_message_id TEXT,
                 updated_time REAL,
                 ocr_status TEXT DEFAULT 'pending',
-                ocr_fail_count INTEGER DEFAULT 0
+                ocr_fail_count INTEGER DEFAULT 0,
+                telegram_file_unique_id TEXT,
+                ocr_last_attempt REAL DEFAULT 0
             )
         ''')
+        # 为旧版本数据库补充新增的列
+        self._ensure_column(cursor, 'telegram_file_unique_id', 'TEXT')
+        self._ensure_column(cursor, 'ocr_last_attempt', 'REAL DEFAULT 0')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_file_hash ON image_features(file_hash)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_phash ON image_features(phash)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_ocr_status ON image_features(ocr_status)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_file_unique_id ON image_features(telegram_file_unique_id)')
         
         # FTS5 for full-text search on OCR text
         cursor.execute('CREATE VIRTUAL TABLE IF NOT EXISTS image_text_search USING fts5(file_path, ocr_text, content="image_features", content_rowid="id")')
@@ -316,6 +339,14 @@ class ImageSimilaritySearcher:
         self.conn.commit()
         self.logger.info("Database initialized successfully.")
 
+    def _ensure_column(self, cursor: sqlite3.Cursor, column: str, definition: str):
+        """如果 image_features 表中不存在指定列，则通过 ALTER TABLE 添加（兼容旧数据库）"""
+        cursor.execute("PRAGMA table_info(image_features)")
+        existing_columns = {row[1] for row in cursor.fetchall()}
+        if column not in existing_columns:
+            cursor.execute(f"ALTER TABLE image_features ADD COLUMN {column} {definition}")
+            self.logger.info(f"Added column '{column}' to image_features table.")
+
     def _get_file_hash(self, file_path: str) -> str:
         """计算文件的MD5哈希值"""
         hash_md5 = hashlib.md5()
@@ -444,15 +475,16 @@ class ImageSimilaritySearcher:
             self.logger.warning(f"Failed to get variants: {e}, returning original keywords")
             return keywords
 
-    def _extract_features(self, image_path: str, ocr_needed: bool = False) -> Optional[Dict]:
+    def _extract_features(self, image_path: str, ocr_needed: bool = False, file_hash: Optional[str] = None) -> Optional[Dict]:
         """
         从图片中提取文件哈希、感知哈希和（可选）OCR文本。
+        file_hash: 调用方已计算好的文件MD5，传入时不再重复读取文件计算。
         """
         img = None
         try:
             img = Image.open(image_path)
             features = {
-                'file_hash': self._get_file_hash(image_path),
+                'file_hash': file_hash or self._get_file_hash(image_path),
                 'phash': str(imagehash.phash(img)),
                 'ocr_text': ""
             }
@@ -473,10 +505,33 @@ class ImageSimilaritySearcher:
                 except Exception as e:
                     self.logger.debug(f"Failed to close image: {e}")
 
-    def add_image_to_index(self, file_path: str, telegram_message_id: str) -> bool:
+    def _extract_features_from_bytes(self, image_bytes: bytes) -> Optional[Dict]:
+        """
+        从内存中的图片数据提取文件哈希和感知哈希（不落盘，供查询使用）。
+        """
+        img = None
+        try:
+            img = Image.open(io.BytesIO(image_bytes))
+            return {
+                'file_hash': hashlib.md5(image_bytes).hexdigest(),
+                'phash': str(imagehash.phash(img)),
+                'ocr_text': ""
+            }
+        except Exception as e:
+            self.logger.error(f"Feature extraction failed for in-memory image: {e}")
+            return None
+        finally:
+            if img is not None:
+                try:
+                    img.close()
+                except Exception as e:
+                    self.logger.debug(f"Failed to close image: {e}")
+
+    def add_image_to_index(self, file_path: str, telegram_message_id: str, file_unique_id: Optional[str] = None) -> bool:
         """
         添加单个文件的索引，包含Telegram消息ID。
         仅计算哈希和感知哈希，OCR标记为pending状态，留待后续定时处理。
+        file_unique_id: Telegram 提供的文件唯一ID，用于后续快速识别重复图片
         成功返回True，失败返回False。
         """
         features = self._extract_features(file_path, ocr_needed=False)
@@ -487,8 +542,8 @@ class ImageSimilaritySearcher:
             cursor = self.conn.cursor()
             try:
                 cursor.execute(
-                    "INSERT OR REPLACE INTO image_features (file_path, file_hash, phash, ocr_text, telegram_message_id, updated_time, ocr_status, ocr_fail_count) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
-                    (file_path, features['file_hash'], features['phash'], "", telegram_message_id, time.time(), 'pending', 0)
+                    "INSERT OR REPLACE INTO image_features (file_path, file_hash, phash, ocr_text, telegram_message_id, updated_time, ocr_status, ocr_fail_count, telegram_file_unique_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (file_path, features['file_hash'], features['phash'], "", telegram_message_id, time.time(), 'pending', 0, file_unique_id)
                 )
                 self.conn.commit()
                 self.logger.info(f"Indexed image: {file_path} with telegram_message_id: '{telegram_message_id}'. OCR status: pending")
@@ -502,24 +557,68 @@ class ImageSimilaritySearcher:
                 self.conn.rollback()
                 return False
 
-    def process_ocr_pending_images(self, batch_size: int = 10, max_retries: int = 3) -> Dict[str, int]:
+    def add_images_to_index_batch(self, entries: List[Tuple[str, str, Optional[str]]]) -> List[bool]:
+        """
+        批量添加图片索引，所有记录在同一个事务中写入并只提交一次。
+        entries: [(file_path, telegram_message_id, file_unique_id), ...]
+        返回与 entries 一一对应的成功标志列表。
+        """
+        results = [False] * len(entries)
+        rows = []
+        row_indexes = []
+        now = time.time()
+        
+        # 特征提取不涉及数据库，在加锁之前完成
+        for i, (file_path, telegram_message_id, file_unique_id) in enumerate(entries):
+            features = self._extract_features(file_path, ocr_needed=False)
+            if not features:
+                continue
+            rows.append((file_path, features['file_hash'], features['phash'], "", telegram_message_id, now, 'pending', 0, file_unique_id))
+            row_indexes.append(i)
+        
+        if not rows:
+            return results
+        
+        with self._db_lock:
+            cursor = self.conn.cursor()
+            try:
+                cursor.executemany(
+                    "INSERT OR REPLACE INTO image_features (file_path, file_hash, phash, ocr_text, telegram_message_id, updated_time, ocr_status, ocr_fail_count, telegram_file_unique_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    rows
+                )
+                self.conn.commit()
+                for i in row_indexes:
+                    results[i] = True
+                self.logger.info(f"Indexed {len(rows)} images in one batch. OCR status: pending")
+            except Exception as e:
+                self.logger.error(f"Failed to add batch of {len(rows)} images to index: {e}")
+                self.conn.rollback()
+        
+        return results
+
+    def process_ocr_pending_images(self, batch_size: int = 10, max_retries: int = 3,
+                                   count_remaining: bool = True,
+                                   retry_base_interval: float = 0) -> Dict[str, int]:
         """
         处理所有OCR状态为pending或failed的图片。
         batch_size: 单次处理的最大图片数量
         max_retries: 最大重试次数（超过此次数的失败图片将被跳过）
-        返回处理统计信息：{'processed': 5, 'succeeded': 4, 'failed': 1, 'skipped': 0}
+        count_remaining: 是否在处理结束后统计剩余待处理数量（为 False 时 remaining 为 None）
+        retry_base_interval: 失败图片重试的基础退避间隔（秒），第 n 次失败后需等待 基础间隔 * 2^(n-1) 秒才会重试，0 表示不退避
+        返回处理统计信息：{'processed': 5, 'succeeded': 4, 'failed': 1, 'skipped': 0, 'remaining': 12}
+        其中 remaining 为本批处理结束后仍待处理的图片数量，调用方无需再单独查询。
         """
-        stats = {'processed': 0, 'succeeded': 0, 'failed': 0, 'skipped': 0}
+        stats = {'processed': 0, 'succeeded': 0, 'failed': 0, 'skipped': 0, 'remaining': 0}
         
         try:
             # 获取待处理的图片（使用锁保护）
             with self._db_lock:
                 cursor = self.conn.cursor()
-                cursor.execute('''
+                cursor.execute(f'''
                     SELECT id, file_path FROM image_features 
-                    WHERE (ocr_status = 'pending' OR (ocr_status = 'failed' AND ocr_fail_count < ?))
+                    WHERE {PENDING_OCR_CONDITION}
                     LIMIT ?
-                ''', (max_retries, batch_size))
+                ''', (max_retries, time.time(), retry_base_interval, batch_size))
                 
                 pending_images = cursor.fetchall()
                 cursor.close()
@@ -577,6 +676,8 @@ class ImageSimilaritySearcher:
                     self._increment_ocr_fail_count(img_id)
                     stats['failed'] += 1
             
+            # 在同一次调用中统计剩余待处理数量，避免调用方额外查询
+            stats['remaining'] = self.get_pending_ocr_count(max_retries, retry_base_interval) if count_remaining else None
             return stats
             
         except Exception as e:
@@ -633,8 +734,8 @@ class ImageSimilaritySearcher:
             cursor = self.conn.cursor()
             try:
                 cursor.execute(
-                    "UPDATE image_features SET ocr_status = 'failed', ocr_fail_count = ocr_fail_count + 1 WHERE id = ?",
-                    (img_id,)
+                    "UPDATE image_features SET ocr_status = 'failed', ocr_fail_count = ocr_fail_count + 1, ocr_last_attempt = ? WHERE id = ?",
+                    (time.time(), img_id)
                 )
                 self.conn.commit()
             except Exception as e:
@@ -655,21 +756,22 @@ class ImageSimilaritySearcher:
                 self.logger.error(f"Failed to mark image as skipped for id {img_id}: {e}")
                 self.conn.rollback()
 
-    def get_pending_ocr_count(self, max_retries: int = 3) -> int:
+    def get_pending_ocr_count(self, max_retries: int = 3, retry_base_interval: float = 0) -> int:
         """
         获取待处理的OCR图片数量（包括pending和可重试的failed）
         
         Args:
             max_retries: 最大重试次数，与 process_ocr_pending_images 保持一致
+            retry_base_interval: 失败重试的基础退避间隔（秒），与 process_ocr_pending_images 保持一致
         """
         with self._db_lock:
             cursor = self.conn.cursor()
             try:
                 # 统计逻辑与 process_ocr_pending_images 保持一致
-                cursor.execute('''
+                cursor.execute(f'''
                     SELECT COUNT(*) FROM image_features 
-                    WHERE (ocr_status = 'pending' OR (ocr_status = 'failed' AND ocr_fail_count < ?))
-                ''', (max_retries,))
+                    WHERE {PENDING_OCR_CONDITION}
+                ''', (max_retries, time.time(), retry_base_interval))
                 count = cursor.fetchone()[0]
                 return count
             except Exception as e:
@@ -688,54 +790,117 @@ class ImageSimilaritySearcher:
                 self.logger.error(f"Failed to get failed OCR count: {e}")
                 return 0
 
-    def get_failed_ocr_records(self, limit: Optional[int] = None) -> List[Dict]:
+    def _failed_ocr_column_sql(self, columns: Tuple[str, ...]) -> str:
+        """校验失败记录查询的列名，并生成 SELECT 列表（计算列使用对应的 SQL 表达式）"""
+        invalid_columns = set(columns) - set(FAILED_OCR_RECORD_COLUMNS) - set(FAILED_OCR_COMPUTED_COLUMNS)
+        if invalid_columns:
+            raise ValueError(f"Unsupported columns for failed OCR records: {sorted(invalid_columns)}")
+        
+        return ', '.join(
+            f"{FAILED_OCR_COMPUTED_COLUMNS[column]} AS {column}" if column in FAILED_OCR_COMPUTED_COLUMNS else column
+            for column in columns
+        )
+
+    def get_failed_ocr_records(self, limit: Optional[int] = None,
+                               columns: Optional[Tuple[str, ...]] = None) -> List[Dict]:
         """
         获取OCR失败的记录列表
         
         Args:
             limit: 返回的最大记录数，None 表示返回所有记录
+            columns: 需要返回的列（必须属于 FAILED_OCR_RECORD_COLUMNS 或 FAILED_OCR_COMPUTED_COLUMNS），
+                     None 表示返回 FAILED_OCR_RECORD_COLUMNS 中的全部列
         
         Returns:
-            包含失败记录信息的字典列表，每个字典包含:
+            包含失败记录信息的字典列表，每个字典包含所请求的列，全部列为:
             - id: 数据库ID
             - file_path: 文件路径
             - telegram_message_id: Telegram消息ID（可能为空）
             - ocr_fail_count: 失败次数
             - updated_time: 更新时间
+            计算列:
+            - file_name: 不含目录的文件名
         """
+        if columns is None:
+            columns = FAILED_OCR_RECORD_COLUMNS
+        column_sql = self._failed_ocr_column_sql(columns)
         with self._db_lock:
             cursor = self.conn.cursor()
             try:
                 if limit is not None:
-                    cursor.execute('''
-                        SELECT id, file_path, telegram_message_id, ocr_fail_count, updated_time
+                    cursor.execute(f'''
+                        SELECT {column_sql}
                         FROM image_features 
                         WHERE ocr_status = 'failed'
-                        ORDER BY updated_time DESC
+                        ORDER BY COALESCE(updated_time, 0) DESC, id DESC
                         LIMIT ?
                     ''', (limit,))
                 else:
-                    cursor.execute('''
-                        SELECT id, file_path, telegram_message_id, ocr_fail_count, updated_time
+                    cursor.execute(f'''
+                        SELECT {column_sql}
                         FROM image_features 
                         WHERE ocr_status = 'failed'
-                        ORDER BY updated_time DESC
+                        ORDER BY COALESCE(updated_time, 0) DESC, id DESC
                     ''')
                 
-                results = []
-                for row in cursor.fetchall():
-                    results.append({
-                        'id': row[0],
-                        'file_path': row[1],
-                        'telegram_message_id': row[2],
-                        'ocr_fail_count': row[3],
-                        'updated_time': row[4]
-                    })
-                return results
+                return [dict(zip(columns, row)) for row in cursor.fetchall()]
             except Exception as e:
                 self.logger.error(f"Failed to get failed OCR records: {e}")
                 return []
 
+    def iter_failed_ocr_records(self, limit: Optional[int] = None,
+                                columns: Optional[Tuple[str, ...]] = None,
+                                page_size: int = 200) -> Iterator[Dict]:
+        """
+        逐条产出OCR失败的记录，顺序、参数和字典格式与 get_failed_ocr_records 相同。
+        按 (updated_time, id) 分页读取（updated_time 为空时视为 0），每页查询完即释放数据库锁，产出记录期间不持有锁。
+        
+        Args:
+            limit: 返回的最大记录数，None 表示返回所有记录
+            columns: 需要返回的列，同 get_failed_ocr_records
+            page_size: 每次从数据库读取的记录数
+        """
+        if columns is None:
+            columns = FAILED_OCR_RECORD_COLUMNS
+        column_sql = self._failed_ocr_column_sql(columns)
+        
+        remaining = limit
+        last_key = None
+        while remaining is None or remaining > 0:
+            fetch_size = page_size if remaining is None else min(page_size, remaining)
+            with self._db_lock:
+                cursor = self.conn.cursor()
+                try:
+                    if last_key is None:
+                        cursor.execute(f'''
+                            SELECT COALESCE(updated_time, 0), id, {column_sql}
+                            FROM image_features
+                            WHERE ocr_status = 'failed'
+                            ORDER BY COALESCE(updated_time, 0) DESC, id DESC
+                            LIMIT ?
+                        ''', (fetch_size,))
+                    else:
+                        cursor.execute(f'''
+                            SELECT COALESCE(updated_time, 0), id, {column_sql}
+                            FROM image_features
+                            WHERE ocr_status = 'failed' AND (COALESCE(updated_time, 0), id) < (?, ?)
+                            ORDER BY COALESCE(updated_time, 0) DESC, id DESC
+                            LIMIT ?
+                        ''', (*last_key, fetch_size))
+                    rows = cursor.fetchall()
+                except Exception as e:
+                    self.logger.error(f"Failed to iterate failed OCR records: {e}")
+                    return
+            
+            for row in rows:
+                yield dict(zip(columns, row[2:]))
+            
+            if len(rows) < fetch_size:
+                return
+            last_key = rows[-1][:2]
+            if remaining is not None:
+                remaining -= len(rows)
+
     def set_manual_ocr_result(self, telegram_message_id: str, ocr_text: str) -> bool:
         """
         手动设置指定消息ID的图片的OCR结果。
@@ -973,6 +1138,81 @@ class ImageSimilaritySearcher:
                 self.logger.error(f"Failed to get OCR result for message_id {telegram_message_id}: {e}")
                 return None
 
+    def _find_exact_record(self, condition: str, value: str, order_by: Optional[str] = None) -> Optional[Dict]:
+        """
+        按指定条件查找一条图片记录（仅供内部使用，condition 必须是受信任的 SQL 条件，例如 "file_hash = ?"）。
+        可能匹配多条记录时通过 order_by（同样必须受信任）决定返回哪一条。
+        返回与 search_similar_images 结果格式相同的字典（similarity 为 1.0），未找到返回None。
+        """
+        query = f"SELECT file_path, telegram_message_id, file_hash, updated_time, ocr_text FROM image_features WHERE {condition}"
+        if order_by:
+            query += f" ORDER BY {order_by}"
+        with self._db_lock:
+            cursor = self.conn.cursor()
+            try:
+                cursor.execute(query + " LIMIT 1", (value,))
+                row = cursor.fetchone()
+                if not row:
+                    return None
+                return {
+                    'path': row[0],
+                    'telegram_message_id': row[1],
+                    'file_hash': row[2],
+                    'updated_time': row[3],
+                    'ocr_text': row[4],
+                    'similarity': 1.0
+                }
+            except Exception as e:
+                self.logger.error(f"Failed to find image by '{condition}' with {value}: {e}")
+                return None
+
+    def find_by_file_unique_id(self, file_unique_id: str) -> Optional[Dict]:
+        """
+        通过 Telegram 的 file_unique_id 查找已索引的图片（索引查询，无需提取图片特征）。
+        
+        Args:
+            file_unique_id: Telegram 文件唯一ID
+            
+        Returns:
+            Optional[Dict]: 与 search_similar_images 结果格式相同的记录（similarity 为 1.0），未找到返回None
+        """
+        if not file_unique_id:
+            return None
+        return self._find_exact_record('telegram_file_unique_id = ?', file_unique_id)
+
+    def find_by_hash(self, file_hash: str) -> Optional[Dict]:
+        """
+        通过文件MD5哈希查找已索引的图片。
+        
+        Args:
+            file_hash: 文件MD5哈希
+            
+        Returns:
+            Optional[Dict]: 与 search_similar_images 结果格式相同的记录（similarity 为 1.0），未找到返回None
+        """
+        if not file_hash:
+            return None
+        return self._find_exact_record('file_hash = ?', file_hash)
+
+    def find_by_file_name_prefix(self, file_name_prefix: str) -> Optional[Dict]:
+        """
+        按文件名前缀查找图片（收到的图片以 "{消息ID}_{file_unique_id}" 命名，归档后文件名不变）。
+        
+        Args:
+            file_name_prefix: 文件名前缀，只应包含数字、字母、下划线和连字符
+            
+        Returns:
+            Optional[Dict]: 与 search_similar_images 结果格式相同的记录（similarity 为 1.0），未找到返回None
+        """
+        if not file_name_prefix:
+            return None
+        # 文件名须以该前缀开头、紧接扩展名，兼容 / 和 \ 两种分隔符；多条匹配时取最新的一条
+        return self._find_exact_record(
+            "file_path GLOB ?",
+            f"*[/\\]{file_name_prefix}.*",
+            order_by="COALESCE(updated_time, 0) DESC, id DESC"
+        )
+
     def _hamming_distance(self, hash1: str, hash2: str) -> int:
         """计算两个哈希字符串之间的汉明距离"""
         # Ensure hashes are of the same length, phash is typically 64-bit (16 hex chars)
@@ -986,12 +1226,40 @@ class ImageSimilaritySearcher:
         搜索相似图像，返回包含文件路径和相关信息的字典列表。
         threshold: 感知哈希的最大汉明距离，低于此距离视为相似。
         max_results: 返回的最大结果数量。
+        先只计算文件MD5按哈希精确查找，命中时直接返回，无需解码图片计算感知哈希。
         """
-        query_features = self._extract_features(query_image_path, ocr_needed=False)
+        try:
+            file_hash = self._get_file_hash(query_image_path)
+        except IOError:
+            return []
+        exact_match = self.find_by_hash(file_hash)
+        if exact_match:
+            self.logger.info(f"Exact match found for {query_image_path}: {exact_match['path']}")
+            return [exact_match]
+        
+        query_features = self._extract_features(query_image_path, ocr_needed=False, file_hash=file_hash)
         if not query_features:
             self.logger.warning(f"Could not extract features from query image: {query_image_path}")
             return []
         
+        return self._search_by_features(query_features, query_image_path, threshold, max_results)
+
+    def search_similar_images_from_bytes(self, image_bytes: bytes, threshold: int = 5, max_results: int = 3) -> List[Dict]:
+        """
+        与 search_similar_images 相同，但查询图片直接以内存中的字节数据传入，无需写入临时文件。
+        """
+        query_features = self._extract_features_from_bytes(image_bytes)
+        if not query_features:
+            self.logger.warning("Could not extract features from in-memory query image")
+            return []
+        
+        return self._search_by_features(query_features, "<memory>", threshold, max_results)
+
+    def _search_by_features(self, query_features: Dict, query_label: str, threshold: int, max_results: int) -> List[Dict]:
+        """
+        根据已提取的查询特征搜索：先按文件哈希精确匹配，再按感知哈希的汉明距离查找相似图片。
+        query_label 仅用于日志输出。
+        """
         with self._db_lock:
             cursor = self.conn.cursor()
             
@@ -1000,7 +1268,7 @@ class ImageSimilaritySearcher:
                 cursor.execute('SELECT file_path, telegram_message_id, file_hash, updated_time, ocr_text FROM image_features WHERE file_hash = ?', (query_features['file_hash'],))
                 exact_match = cursor.fetchone()
                 if exact_match:
-                    self.logger.info(f"Exact match found for {query_image_path}: {exact_match[0]}")
+                    self.logger.info(f"Exact match found for {query_label}: {exact_match[0]}")
                     return [{
                         'path': exact_match[0],
                         'telegram_message_id': exact_match[1],
@@ -1029,7 +1297,7 @@ class ImageSimilaritySearcher:
                         })
                 
                 results.sort(key=lambda x: x['similarity'], reverse=True)
-                self.logger.info(f"Found {len(results)} similar images for {query_image_path} (threshold={threshold}).")
+                self.logger.info(f"Found {len(results)} similar images for {query_label} (threshold={threshold}).")
                 return results[:max_results]
             
             except Exception as e:
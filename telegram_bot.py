@@ -1,12 +1,33 @@
+import atexit
+import errno
 import logging
+import queue
+import math
 import os
+import random
+import re
 import shutil
 import glob
+import html
+import io
 import signal
 import sys
+import tempfile
 from uuid import uuid4
-from datetime import datetime, time
+from datetime import datetime, time, timedelta, timezone
 import asyncio
+from collections import Counter, OrderedDict, defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial, wraps
+from time import monotonic
+from logging.handlers import QueueHandler, QueueListener
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:
+    # Windows 没有 resource 模块
+    resource = None
 
 try:
     from zoneinfo import ZoneInfo
@@ -17,26 +38,46 @@ except ImportError:
     except ImportError:
         ZoneInfo = None
 
+# 定时任务按北京时间配置；缺少时区数据时回退为固定的 UTC+8（上海无夏令时，结果相同）
+try:
+    BEIJING_TZ = ZoneInfo("Asia/Shanghai")
+except Exception:
+    BEIJING_TZ = timezone(timedelta(hours=8))
+
 from telegram import Update, InputFile, MessageOriginChannel, InlineKeyboardButton, InlineKeyboardMarkup, InputMediaPhoto
+from telegram.error import BadRequest, NetworkError, RetryAfter
 from telegram.ext import ApplicationBuilder, ContextTypes, CommandHandler, MessageHandler, filters, CallbackQueryHandler
 
 from config import (BOT_TOKEN, ALLOWED_USER_ID, IMAGE_DOWNLOAD_PATH, DB_PATH, LOG_FILE_PATH,
                    MAX_IMAGES_IN_DOWNLOAD_FOLDER, OCR_SCHEDULED_TIME, OCR_MAX_RETRIES, OCR_BATCH_SIZE,
                    MAX_RESULTS, SCHEDULER_MISFIRE_GRACE_TIME, SCHEDULER_MAX_INSTANCES, SCHEDULER_COALESCE,
-                   FAILED_OCR_DEFAULT_LIMIT, FIND_PAGINATION_ENABLED, FIND_PAGE_SIZE)
+                   FAILED_OCR_DEFAULT_LIMIT, FIND_PAGINATION_ENABLED, FIND_PAGE_SIZE,
+                   TELEGRAM_HTTP_VERSION, OCR_RETRY_BASE_INTERVAL)
 from image_searcher import ImageSimilaritySearcher
 
 from typing import Dict, Optional, List, Tuple
 
 # --- 日志设置 ---
+# 日志记录只写入内存队列，由后台线程的 QueueListener 负责实际的文件/控制台输出，
+# 避免写日志文件时阻塞事件循环
+log_formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+log_file_handler = logging.FileHandler(LOG_FILE_PATH)
+log_file_handler.setFormatter(log_formatter)
+log_stream_handler = logging.StreamHandler()
+log_stream_handler.setFormatter(log_formatter)
+
+log_queue = queue.Queue(-1)
+log_queue_handler = QueueHandler(log_queue)
+# 入队时只保留消息本身（含异常堆栈），完整格式由输出端的 handler 负责
+log_queue_handler.setFormatter(logging.Formatter('%(message)s'))
+LOG_LISTENER = QueueListener(log_queue, log_file_handler, log_stream_handler, respect_handler_level=True)
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(LOG_FILE_PATH),
-        logging.StreamHandler()
-    ]
+    handlers=[log_queue_handler]
 )
+LOG_LISTENER.start()
+# 进程退出时（包括信号处理器中的 sys.exit）刷新并停止日志线程
+atexit.register(LOG_LISTENER.stop)
 logger = logging.getLogger(__name__)
 
 # 控制台输出的日志中，httpx的相关日志不需要写入bot.log。
@@ -45,7 +86,12 @@ logging.getLogger('httpx').setLevel(logging.WARNING)
 logging.getLogger('httpcore').setLevel(logging.WARNING)
 
 
-def create_progress_bar(current: int, total: int, bar_length: int = 20) -> str:
+# 默认长度（20）下所有可能的进度条，避免每次更新进度时重新拼接字符串
+PROGRESS_BAR_LENGTH = 20
+PROGRESS_BARS = tuple("█" * i + "░" * (PROGRESS_BAR_LENGTH - i) for i in range(PROGRESS_BAR_LENGTH + 1))
+
+
+def create_progress_bar(current: int, total: int, bar_length: int = PROGRESS_BAR_LENGTH) -> str:
     """
     创建 ASCII 进度条。
     :param current: 当前进度
@@ -58,12 +104,85 @@ def create_progress_bar(current: int, total: int, bar_length: int = 20) -> str:
 
     percentage = current / total
     filled = int(bar_length * percentage)
-    bar = "█" * filled + "░" * (bar_length - filled)
+    if bar_length == PROGRESS_BAR_LENGTH and 0 <= filled <= PROGRESS_BAR_LENGTH:
+        bar = PROGRESS_BARS[filled]
+    else:
+        bar = "█" * filled + "░" * (bar_length - filled)
     percent_str = f"{percentage * 100:.1f}%"
 
     return f"{bar} {percent_str}"
 
 
+# 搜索结果/重复图片说明中的文件信息部分（HTML 格式，发送时需使用 parse_mode='HTML'）
+RESULT_DETAILS_TEMPLATE = "文件路径: <code>{file_name}</code>\n文件哈希: <code>{file_hash}</code>\n更新时间: {updated_time}"
+
+
+@lru_cache(maxsize=1024)
+def format_timestamp(timestamp: float) -> str:
+    """将时间戳格式化为 YYYY-MM-DD HH:MM:SS（结果会被缓存）"""
+    return datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S')
+
+
+@lru_cache(maxsize=2048)
+def format_timestamp_minute(timestamp_minute: int) -> str:
+    """将以分钟为单位的时间戳格式化为 MM-DD HH:MM（按分钟缓存，同一分钟内的记录共用结果）"""
+    return datetime.fromtimestamp(timestamp_minute * 60).strftime('%m-%d %H:%M')
+
+
+def build_result_details(result: Dict) -> str:
+    """构建图片记录的文件路径、哈希和更新时间说明（文件名已做 HTML 转义）"""
+    return RESULT_DETAILS_TEMPLATE.format_map({
+        'file_name': html.escape(os.path.basename(result['path'])),
+        'file_hash': result['file_hash'],
+        'updated_time': format_timestamp(result['updated_time']),
+    })
+
+
+def build_result_caption(result: Dict) -> str:
+    """构建相似搜索结果图片的说明文字（HTML 格式）"""
+    caption_parts = []
+    if result.get('telegram_message_id'):
+        caption_parts.append(f"原消息ID: {html.escape(str(result['telegram_message_id']))}")
+    caption_parts.append(build_result_details(result))
+    if 'similarity' in result:
+        caption_parts.append(f"相似度: {result['similarity']:.2%}")
+    if result.get('ocr_text'):
+        display_ocr_text = result['ocr_text'][:100] + "..." if len(result['ocr_text']) > 100 else result['ocr_text']
+        caption_parts.append(f"OCR文本: <code>{html.escape(display_ocr_text)}</code>")
+    return "\n".join(caption_parts)
+
+
+async def read_file_bytes(path: str) -> bytes:
+    """在工作线程中读取文件内容，避免大图片的磁盘读取阻塞事件循环"""
+    return await asyncio.to_thread(Path(path).read_bytes)
+
+
+def get_existing_paths(paths: List[str]) -> set:
+    """
+    批量检查文件是否存在：按所在目录分组，每个目录只 scandir 一次，代替逐个 os.path.exists。
+    
+    Args:
+        paths: 文件路径列表
+        
+    Returns:
+        set: 其中实际存在的文件路径
+    """
+    names_by_dir = defaultdict(set)
+    for path in paths:
+        directory, name = os.path.split(path)
+        names_by_dir[directory].add(name)
+    
+    existing = set()
+    for directory, names in names_by_dir.items():
+        try:
+            with os.scandir(directory or '.') as entries:
+                found = {entry.name for entry in entries if entry.name in names}
+        except OSError:
+            continue
+        existing.update(os.path.join(directory, name) for name in found)
+    return existing
+
+
 def get_find_page_size() -> int:
     """
     获取 /find 分页每页数量，并限制在 1-9 之间。
@@ -172,8 +291,7 @@ async def render_find_page(
             logger.warning(f"Search result file not found: {result['path']}")
             continue
         try:
-            with open(result['path'], 'rb') as photo_file:
-                media_group.append(InputMediaPhoto(media=photo_file.read()))
+            media_group.append(InputMediaPhoto(media=await read_file_bytes(result['path'])))
         except Exception as e:
             logger.error(f"发送搜索结果图片失败: {e}")
 
@@ -201,25 +319,209 @@ async def render_find_page(
     state["summary_message_id"] = summary_message_id
 
 
+# /find 的选项参数：-5 / -n=5 / --max=5 限制结果数，--exact / --comprehensive (--com) / --contains 指定模式
+FIND_ARG_PATTERN = re.compile(r'^(?:(?:-n=|--max=|-)(\d+)|--(exact|comprehensive|com|contains))$')
+
+# 机器人保存的图片文件名格式为 {message_id}_{file_unique_id}.{ext}，用于提取消息ID
+MSG_ID_PATTERN = re.compile(r'^(\d+)_')
+
+# /find 用法错误时的帮助信息（HTML）
+FIND_HELP_TEXT = """使用方法：
+1. <code>/find &lt;关键词&gt;</code> (精确匹配，不分词)
+2. <code>/find --comprehensive &lt;关键词&gt;</code> 或 <code>/find --com &lt;关键词&gt;</code> (全面搜索，包含分词)
+3. <code>/find --contains &lt;关键词&gt;</code> (内存遍历搜索，最准确)
+4. 回复一张图片并发送 <code>/find</code> (图片搜索)"""
+
+
 # --- 初始化搜索器和下载路径 ---
 searcher = ImageSimilaritySearcher(db_path=DB_PATH)
 os.makedirs(IMAGE_DOWNLOAD_PATH, exist_ok=True)
 logger.info(f"Image download path: {IMAGE_DOWNLOAD_PATH}")
+# 预先拼接好下载目录前缀，热路径中直接拼接文件名。
+# 不用 Path 规范化（会去掉 "./"），保证与归档时 os.path.join 得到的路径一致，否则归档后无法更新数据库中的路径
+DOWNLOAD_PATH_PREFIX = os.path.join(IMAGE_DOWNLOAD_PATH, "")
+
+# 以下 asyncio 同步对象都在 application 启动时（post_init）由 create_async_primitives 创建，
+# 以绑定到实际运行的事件循环；Application 出错重建后会重新创建
+# 图片消息处理器以非阻塞方式并发运行（转发相册时会同时收到多条图片消息），
+# 通过信号量限制同时进行的下载数量，避免触发 Telegram 的限流
+DOWNLOAD_CONCURRENCY = 4
+DOWNLOAD_SEM: Optional[asyncio.Semaphore] = None
+# 限制并发发送搜索结果图片的数量
+SEND_CONCURRENCY = 10
+SEND_SEM: Optional[asyncio.Semaphore] = None
+# 防止并发的图片处理同时触发多次归档
+ARCHIVE_LOCK: Optional[asyncio.Lock] = None
+# 已改名为正式文件名但尚未写入索引的图片文件名，归档时跳过这些文件
+INDEXING_FILE_NAMES = set()
+# 定时OCR任务每隔多少轮从数据库重新统计一次剩余数量，其余轮次按处理结果推算
+OCR_RECOUNT_INTERVAL = 5
+# OCR 批处理专用线程池：同一时间只运行一个批次，限制峰值内存，也不占用默认线程池
+OCR_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ocr")
+# 单批 OCR 的最长等待时间（秒）
+OCR_BATCH_TIMEOUT = 600.0
+
+
+class AsyncRateLimiter:
+    """
+    异步滑动窗口限流器：任意 time_period 秒内最多放行 max_rate 次。
+    用法：async with limiter: ...
+    """
+    
+    def __init__(self, max_rate: int, time_period: float):
+        self.max_rate = max_rate
+        self.time_period = time_period
+        self._timestamps = deque()
+        self._lock = asyncio.Lock()
+        self._paused_until = 0.0
+    
+    def pause(self, seconds: float):
+        """在接下来的 seconds 秒内暂停放行（例如收到 Telegram 的 RetryAfter 时）"""
+        self._paused_until = max(self._paused_until, monotonic() + seconds)
+    
+    async def acquire(self):
+        """等待直到可以放行一次请求"""
+        async with self._lock:
+            while True:
+                now = monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                while self._timestamps and now - self._timestamps[0] >= self.time_period:
+                    self._timestamps.popleft()
+                if len(self._timestamps) < self.max_rate:
+                    self._timestamps.append(now)
+                    return
+                await asyncio.sleep(self.time_period - (now - self._timestamps[0]))
+    
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        return False
+
 
+# Telegram 全局发送限制约为 30 条/秒，留出余量
+SEND_RATE = (25, 1)
+SEND_LIMITER: Optional[AsyncRateLimiter] = None
+# 单个聊天的发送速率：持续约 3.3 条/秒（不低于原先每条间隔 0.3 秒的速度），允许 20 条的短时突发
+CHAT_SEND_RATE = (20, 6)
+CHAT_SEND_LIMITERS: Dict[int, AsyncRateLimiter] = {}
 
-def get_image_files_in_folder(folder_path: str) -> List[str]:
+# /failed 中无法定位原消息的记录每条消息合并显示的数量
+FAILED_ORPHAN_CHUNK_SIZE = 10
+FAILED_ORPHAN_HEADER = "⚠️ 以下失败记录无法定位原消息：\n"
+# /failed 在途（已开始发送、尚未完成）消息数的上限，达到上限时先等待部分消息发送完成再继续读取记录
+FAILED_SEND_MAX_PENDING = 20
+# Telegram 单条文本消息的最大长度
+TELEGRAM_MESSAGE_MAX_LENGTH = 4096
+
+
+def get_chat_limiter(chat_id: int) -> AsyncRateLimiter:
+    """获取指定聊天的发送限流器（按需创建）"""
+    limiter = CHAT_SEND_LIMITERS.get(chat_id)
+    if limiter is None:
+        limiter = CHAT_SEND_LIMITERS[chat_id] = AsyncRateLimiter(*CHAT_SEND_RATE)
+    return limiter
+
+
+async def send_with_retry(bot, max_attempts: int = 3, limiters: Tuple[AsyncRateLimiter, ...] = (), **kwargs):
+    """
+    发送消息，遇到限流或网络错误时重试。
+    - RetryAfter：按 Telegram 要求的时间等待，并暂停全局限流器
+    - BadRequest（例如回复的消息已被删除）：永久错误，直接抛出
+    - 其他网络错误（含超时）：指数退避加随机抖动后重试
+    
+    Args:
+        bot: Telegram Bot 对象
+        max_attempts: 最大尝试次数
+        limiters: 每次尝试前需要通过的限流器
+        **kwargs: 传给 bot.send_message 的参数
+    """
+    for attempt in range(1, max_attempts + 1):
+        for limiter in limiters:
+            await limiter.acquire()
+        try:
+            return await bot.send_message(**kwargs)
+        except RetryAfter as e:
+            if attempt == max_attempts:
+                raise
+            retry_after = e.retry_after
+            if isinstance(retry_after, timedelta):
+                retry_after = retry_after.total_seconds()
+            logger.warning(f"Flood control exceeded, retrying in {retry_after}s")
+            SEND_LIMITER.pause(retry_after)
+            await asyncio.sleep(retry_after)
+        except BadRequest:
+            raise
+        except NetworkError as e:
+            if attempt == max_attempts:
+                raise
+            delay = 2 ** attempt + random.random()
+            logger.warning(f"Network error while sending message ({e}), retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+# 新图片索引的批量写入：攒够 INDEX_BATCH_SIZE 条或等待 INDEX_FLUSH_INTERVAL 秒后统一提交一次
+INDEX_BATCH_SIZE = 50
+INDEX_FLUSH_INTERVAL = 0.5
+# 队列与后台任务在 application 启动时（post_init）创建，以绑定到实际运行的事件循环
+INDEX_QUEUE: Optional[asyncio.Queue] = None
+INDEX_WORKER_TASK: Optional[asyncio.Task] = None
+
+# 出站消息队列：由少量后台任务统一进行限流、重试后发送，同样在 post_init 中创建
+OUTBOUND_QUEUE_SIZE = 1000
+OUTBOUND_WORKER_COUNT = 4
+OUTBOUND_QUEUE: Optional[asyncio.Queue] = None
+OUTBOUND_WORKER_TASKS: List[asyncio.Task] = []
+
+# 下载文件夹中图片数量的内存计数，首次检查归档时通过一次列目录初始化，
+# 之后新图片入库时递增，只有达到阈值才真正列目录归档
+DOWNLOAD_FILE_COUNT: Optional[int] = None
+
+# 回复图片命令（/tag、/link、/untag、/getocr）的 file_unique_id -> file_hash 缓存（LRU），
+# 同一张图片再次使用命令时无需重新下载和提取特征；只缓存哈希，记录内容每次从数据库读取以保证最新
+REPLIED_PHOTO_CACHE_SIZE = 512
+REPLIED_PHOTO_HASH_CACHE: "OrderedDict[str, str]" = OrderedDict()
+
+# /ocr 循环中每隔 GC_CHECK_INTERVAL 批检查一次峰值内存，增长超过 GC_RSS_GROWTH_KB 才触发垃圾回收
+GC_CHECK_INTERVAL = 4
+GC_RSS_GROWTH_KB = 200_000
+
+# 待处理OCR数量的短时缓存，连续收到多张图片时避免每张都查询一次数据库
+PENDING_COUNT_TTL = 2.0
+PENDING_COUNT_CACHE = {'timestamp': -math.inf, 'value': 0}
+
+
+# 归档统计时识别的图片扩展名（小写）
+IMAGE_EXTENSIONS = frozenset({'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.webp'})
+
+
+def get_image_files_in_folder(folder_path: str) -> List[Tuple[str, float]]:
     """
-    获取指定文件夹下所有图片文件的路径。
+    获取指定文件夹下所有图片文件的路径及其修改时间。
     过滤掉子文件夹，只查找顶层图片文件。
+    使用 os.scandir 单次遍历目录，返回 (文件路径, 修改时间) 列表，
+    调用方无需再对每个文件单独调用 os.path.getmtime。
     """
-    image_extensions = ('.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.webp')
     files = []
     try:
-        for item in os.listdir(folder_path):
-            item_path = os.path.join(folder_path, item)
-            # 确保是文件且不是目录
-            if os.path.isfile(item_path) and item_path.lower().endswith(image_extensions):
-                files.append(item_path)
+        with os.scandir(folder_path) as entries:
+            for entry in entries:
+                name = entry.name
+                # 跳过正在下载/处理中的临时文件
+                if name.startswith('temp_'):
+                    continue
+                # 只对扩展名部分做小写转换，并用集合查找
+                dot = name.rfind('.')
+                if dot == -1 or name[dot:].lower() not in IMAGE_EXTENSIONS:
+                    continue
+                try:
+                    # 确保是文件且不是目录（DirEntry 会缓存类型信息，通常无需额外 stat）
+                    if entry.is_file(follow_symlinks=False):
+                        files.append((entry.path, entry.stat().st_mtime))
+                except OSError as e:
+                    logger.warning(f"Cannot access file {entry.path}: {e}. Skipping.")
     except OSError as e:
         logger.error(f"Error listing files in {folder_path}: {e}")
     except Exception as e:
@@ -228,115 +530,408 @@ def get_image_files_in_folder(folder_path: str) -> List[str]:
     return files
 
 
-async def check_and_archive_images(download_folder: str, max_count: int, searcher_instance: ImageSimilaritySearcher, context: ContextTypes.DEFAULT_TYPE):
+def move_file(src: str, dst: str) -> None:
     """
-    检查下载文件夹中的图片数量，如果达到阈值则进行归档。
-    归档规则：所有图片移动到一个新文件夹，命名为 A_B (最早修改日期_最晚修改日期)。
-    并更新数据库中的文件路径。
+    移动单个文件。
+    同一文件系统内直接使用 os.replace（仅重命名目录项，不复制数据），
+    跨文件系统（EXDEV）时才回退为复制+删除。
+    回退时使用 shutil.copy2：内部经由 shutil.copyfile，在 Linux 上走 os.sendfile 零拷贝路径，
+    同时保留文件的修改时间（归档文件夹的命名依赖 mtime）。
+    """
+    try:
+        os.replace(src, dst)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        shutil.copy2(src, dst)
+        os.unlink(src)
+
+
+def move_files_to_folder(file_paths: List[str], target_folder: str) -> Tuple[List[Tuple[str, str]], List[str]]:
+    """
+    将文件批量移动到目标文件夹（同步函数，应通过 asyncio.to_thread 在工作线程中调用）。
+    返回 (成功移动的 (旧路径, 新路径) 列表, 移动失败的路径列表)。
+    """
+    moved = []
+    failed = []
+    for old_path in file_paths:
+        try:
+            file_name = os.path.basename(old_path)
+            new_path = os.path.join(target_folder, file_name)
+
+            # 避免覆盖同名文件
+            # 冲突时追加随机后缀，无需逐个探测可用的编号
+            if os.path.exists(new_path):
+                name, ext = os.path.splitext(file_name)
+                new_path = os.path.join(target_folder, f"{name}_{uuid4().hex[:8]}{ext}")
+                logger.info(f"File name conflict, renamed to: {os.path.basename(new_path)}")
+
+            move_file(old_path, new_path)
+            moved.append((old_path, new_path))
+            logger.debug(f"Moved {old_path} to {new_path}")
+        except OSError as e:
+            logger.error(f"Failed to move file {old_path} during archiving: {e}")
+            failed.append(old_path)
+        except Exception as e:
+            logger.error(f"Unexpected error moving file {old_path}: {e}")
+            failed.append(old_path)
+    return moved, failed
+
+
+def archive_images_sync(download_folder: str, max_count: int) -> Optional[Tuple[List[Tuple[str, str]], List[str], str]]:
+    """
+    归档逻辑的同步部分（列目录、获取修改时间、创建归档文件夹、移动文件），
+    应通过 asyncio.to_thread 在工作线程中调用，避免阻塞事件循环。
+    未达到归档阈值或无法归档时返回 None，
+    否则返回 (成功移动的 (旧路径, 新路径) 列表, 移动失败的路径列表, 归档文件夹名)。
     """
     if not os.path.exists(download_folder):
         logger.warning(f"Download folder does not exist: {download_folder}")
-        return
+        return None
 
     logger.info(f"Checking image count in {download_folder}...")
-    image_files = get_image_files_in_folder(download_folder)
+    # 跳过已改名但尚未写入索引的图片，它们会在建立索引后参与下一次归档
+    image_files = [
+        (fpath, mtime) for fpath, mtime in get_image_files_in_folder(download_folder)
+        if os.path.basename(fpath) not in INDEXING_FILE_NAMES
+    ]
 
-    if len(image_files) >= max_count:
-        logger.info(f"Image count ({len(image_files)}) reached or exceeded {max_count}. Initiating archive process.")
+    if len(image_files) < max_count:
+        logger.info(f"Image count ({len(image_files)}) is below {max_count}. No archive needed.")
+        return None
 
-        file_modification_times = []
-        valid_image_files = []
-        for fpath in image_files:
-            try:
-                # Using st_mtime (last modification time) as it's generally reliable
-                # and reflects when the file was last written (downloaded).
-                mtime = os.path.getmtime(fpath)
-                file_modification_times.append(mtime)
-                valid_image_files.append(fpath)
-            except OSError as e:
-                logger.warning(f"Cannot access file {fpath}: {e}. Skipping.")
-                continue
-            except Exception as e:
-                logger.error(f"Unexpected error getting modification time for {fpath}: {e}. Skipping.")
-                continue
+    logger.info(f"Image count ({len(image_files)}) reached or exceeded {max_count}. Initiating archive process.")
+
+    # 修改时间已在列目录时一并获取
+    # Using st_mtime (last modification time) as it's generally reliable
+    # and reflects when the file was last written (downloaded).
+    # 单次遍历同时求出最早和最晚修改时间
+    valid_image_files = []
+    min_mtime = math.inf
+    max_mtime = -math.inf
+    for fpath, mtime in image_files:
+        valid_image_files.append(fpath)
+        if mtime < min_mtime:
+            min_mtime = mtime
+        if mtime > max_mtime:
+            max_mtime = mtime
+
+    if not valid_image_files:
+        logger.warning("No valid image files found to archive.")
+        return None
 
-        if not valid_image_files:
-            logger.warning("No valid image files found to archive.")
-            return
+    min_time = datetime.fromtimestamp(min_mtime)
+    max_time = datetime.fromtimestamp(max_mtime)
 
-        if not file_modification_times:
-            logger.warning("No modification times collected for archiving.")
-            return
+    # Format folder name as YYYY.MM.DD_YYYY.MM.DD
+    folder_name = f"{min_time.strftime('%Y.%m.%d')}_{max_time.strftime('%Y.%m.%d')}"
+    archive_path = os.path.join(download_folder, folder_name)
 
-        min_time = datetime.fromtimestamp(min(file_modification_times))
-        max_time = datetime.fromtimestamp(max(file_modification_times))
+    try:
+        os.makedirs(archive_path, exist_ok=True)
+        logger.info(f"Created archive folder: {archive_path}")
+    except OSError as e:
+        logger.error(f"Failed to create archive folder {archive_path}: {e}")
+        return None
 
-        # Format folder name as YYYY.MM.DD_YYYY.MM.DD
-        folder_name = f"{min_time.strftime('%Y.%m.%d')}_{max_time.strftime('%Y.%m.%d')}"
-        archive_path = os.path.join(download_folder, folder_name)
+    old_new_paths, failed_moves = move_files_to_folder(valid_image_files, archive_path)
+    return old_new_paths, failed_moves, folder_name
 
-        try:
-            os.makedirs(archive_path, exist_ok=True)
-            logger.info(f"Created archive folder: {archive_path}")
-        except OSError as e:
-            logger.error(f"Failed to create archive folder {archive_path}: {e}")
-            return
 
-        old_new_paths_for_db = []
-        successful_moves_count = 0
-        failed_moves = []
+def note_downloaded_image():
+    """新图片保存到下载文件夹后调用，递增内存中的图片计数（尚未初始化时由首次归档检查负责统计）"""
+    global DOWNLOAD_FILE_COUNT
+    if DOWNLOAD_FILE_COUNT is not None:
+        DOWNLOAD_FILE_COUNT += 1
 
-        for old_path in valid_image_files:
-            try:
-                file_name = os.path.basename(old_path)
-                new_path = os.path.join(archive_path, file_name)
-
-                # 避免覆盖同名文件
-                if os.path.exists(new_path):
-                    name, ext = os.path.splitext(file_name)
-                    counter = 1
-                    while os.path.exists(new_path):
-                        new_path = os.path.join(archive_path, f"{name}_{counter}{ext}")
-                        counter += 1
-                    logger.info(f"File name conflict, renamed to: {os.path.basename(new_path)}")
-
-                shutil.move(old_path, new_path)
-                old_new_paths_for_db.append((old_path, new_path))
-                successful_moves_count += 1
-                logger.debug(f"Moved {old_path} to {new_path}")
-            except OSError as e:
-                logger.error(f"Failed to move file {old_path} during archiving: {e}")
-                failed_moves.append(old_path)
-            except Exception as e:
-                logger.error(f"Unexpected error moving file {old_path}: {e}")
-                failed_moves.append(old_path)
 
-        # 更新数据库
+async def check_and_archive_images(download_folder: str, max_count: int, searcher_instance: ImageSimilaritySearcher, context: ContextTypes.DEFAULT_TYPE):
+    """
+    检查下载文件夹中的图片数量，如果达到阈值则进行归档。
+    归档规则：所有图片移动到一个新文件夹，命名为 A_B (最早修改日期_最晚修改日期)。
+    并更新数据库中的文件路径。
+    文件操作与数据库批量更新均在工作线程中执行，完成后再发送通知。
+    """
+    global DOWNLOAD_FILE_COUNT
+
+    if ARCHIVE_LOCK.locked():
+        logger.info("Archive already in progress, skipping this check.")
+        return
+
+    if DOWNLOAD_FILE_COUNT is None:
+        DOWNLOAD_FILE_COUNT = len(await asyncio.to_thread(get_image_files_in_folder, download_folder))
+        logger.info(f"Initialized download folder image count: {DOWNLOAD_FILE_COUNT}")
+
+    # 计数未达到阈值时无需列目录
+    if DOWNLOAD_FILE_COUNT < max_count:
+        return
+
+    async with ARCHIVE_LOCK:
+        archive_result = await asyncio.to_thread(archive_images_sync, download_folder, max_count)
+        # 归档（或确认无需归档）后按实际文件数重新同步计数
+        DOWNLOAD_FILE_COUNT = len(await asyncio.to_thread(get_image_files_in_folder, download_folder))
+        if archive_result is None:
+            return
+
+        old_new_paths_for_db, failed_moves, folder_name = archive_result
+        successful_moves_count = len(old_new_paths_for_db)
+
+        # 更新数据库（executemany + 单次提交）
         if old_new_paths_for_db:
             try:
                 logger.info(f"Updating database paths for {len(old_new_paths_for_db)} archived images.")
-                searcher_instance.update_archived_file_paths(old_new_paths_for_db)
+                await asyncio.to_thread(searcher_instance.update_archived_file_paths, old_new_paths_for_db)
                 logger.info("Database paths updated successfully.")
             except Exception as e:
                 logger.error(f"Failed to update database paths: {e}")
         else:
             logger.warning("No files were successfully moved, database not updated.")
 
-        # 发送完成消息
-        message = f"下载文件夹已归档。\n新文件夹: `{folder_name}`\n归档图片数量: {successful_moves_count}"
-        if failed_moves:
-            message += f"\n失败数量: {len(failed_moves)}"
+    # 发送完成消息
+    message = f"下载文件夹已归档。\n新文件夹: `{folder_name}`\n归档图片数量: {successful_moves_count}"
+    if failed_moves:
+        message += f"\n失败数量: {len(failed_moves)}"
+
+    try:
+        await context.bot.send_message(
+            chat_id=ALLOWED_USER_ID,
+            text=message,
+            parse_mode='Markdown'
+        )
+    except Exception as e:
+        logger.error(f"Failed to send archive notification: {e}")
+
+
+async def index_batch_worker(index_queue: asyncio.Queue):
+    """
+    后台任务：从队列中收集待索引图片，批量写入数据库，并通过 future 通知各个等待者结果。
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        batch = [await index_queue.get()]
+        deadline = loop.time() + INDEX_FLUSH_INTERVAL
+        while len(batch) < INDEX_BATCH_SIZE:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(index_queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        
+        entries = [(file_path, msg_id, file_unique_id) for file_path, msg_id, file_unique_id, _ in batch]
+        try:
+            results = await asyncio.to_thread(searcher.add_images_to_index_batch, entries)
+        except asyncio.CancelledError:
+            # 任务被停止时通知本批次的等待者，避免处理器一直等待（其文件会一直被排除在归档之外）
+            for *_, future in batch:
+                if not future.done():
+                    future.set_result(False)
+            raise
+        except Exception as e:
+            logger.error(f"Batch indexing of {len(batch)} images failed: {e}")
+            results = [False] * len(batch)
+        
+        for (*_, future), success in zip(batch, results):
+            if not future.done():
+                future.set_result(success)
+
+
+async def index_image(file_path: str, telegram_message_id: str, file_unique_id: Optional[str] = None) -> bool:
+    """
+    将图片加入批量索引队列，并等待其所在批次提交完成。
+    后台任务未启动时直接单条写入。
+    文件在等待批次提交期间仍没有索引记录，调用方需在本函数返回前将其文件名保留在 INDEXING_FILE_NAMES 中。
+    """
+    if INDEX_QUEUE is None:
+        return await asyncio.to_thread(searcher.add_image_to_index, file_path, telegram_message_id, file_unique_id)
+    
+    future = asyncio.get_running_loop().create_future()
+    await INDEX_QUEUE.put((file_path, telegram_message_id, file_unique_id, future))
+    return await future
+
 
+def create_async_primitives():
+    """
+    创建信号量、锁和限流器。
+    这些对象在首次发生等待时绑定到当时的事件循环，之后不能在其他事件循环中使用，
+    因此每次启动 Application 时（post_init）都重新创建，旧的单聊天限流器一并丢弃。
+    """
+    global DOWNLOAD_SEM, SEND_SEM, ARCHIVE_LOCK, SEND_LIMITER
+    DOWNLOAD_SEM = asyncio.Semaphore(DOWNLOAD_CONCURRENCY)
+    SEND_SEM = asyncio.Semaphore(SEND_CONCURRENCY)
+    ARCHIVE_LOCK = asyncio.Lock()
+    SEND_LIMITER = AsyncRateLimiter(*SEND_RATE)
+    CHAT_SEND_LIMITERS.clear()
+
+
+async def start_index_worker(application):
+    """post_init 回调：创建并发控制对象和索引队列，并启动批量写入任务"""
+    global INDEX_QUEUE, INDEX_WORKER_TASK
+    create_async_primitives()
+    INDEX_QUEUE = asyncio.Queue()
+    INDEX_WORKER_TASK = asyncio.create_task(index_batch_worker(INDEX_QUEUE))
+    logger.info("Index batch worker started")
+
+
+async def stop_index_worker(application):
+    """post_shutdown 回调：停止批量写入任务，队列中未处理的请求均标记为失败"""
+    global INDEX_QUEUE, INDEX_WORKER_TASK
+    if INDEX_WORKER_TASK:
+        INDEX_WORKER_TASK.cancel()
+        try:
+            await INDEX_WORKER_TASK
+        except asyncio.CancelledError:
+            pass
+    if INDEX_QUEUE:
+        while not INDEX_QUEUE.empty():
+            *_, future = INDEX_QUEUE.get_nowait()
+            if not future.done():
+                future.set_result(False)
+    INDEX_QUEUE = None
+    INDEX_WORKER_TASK = None
+    logger.info("Index batch worker stopped")
+
+
+async def outbound_send_worker(bot, outbound_queue: asyncio.Queue):
+    """
+    后台任务：从出站队列中取出消息，经过全局和单聊天限流后带重试发送，并通过 future 通知发送结果。
+    """
+    while True:
+        kwargs, future = await outbound_queue.get()
+        if future.done():
+            # 调用方已放弃等待（例如超时取消）
+            continue
         try:
-            await context.bot.send_message(
-                chat_id=ALLOWED_USER_ID,
-                text=message,
-                parse_mode='Markdown'
+            result = await send_with_retry(
+                bot,
+                limiters=(SEND_LIMITER, get_chat_limiter(kwargs['chat_id'])),
+                **kwargs
             )
         except Exception as e:
-            logger.error(f"Failed to send archive notification: {e}")
+            if not future.done():
+                future.set_exception(e)
+        else:
+            if not future.done():
+                future.set_result(result)
+
+
+async def send_queued_message(bot, **kwargs):
+    """
+    将消息放入出站队列，并等待其发送完成，返回发送的 Message（发送失败时抛出异常）。
+    后台任务未启动时直接发送。
+    """
+    if OUTBOUND_QUEUE is None:
+        return await send_with_retry(
+            bot,
+            limiters=(SEND_LIMITER, get_chat_limiter(kwargs['chat_id'])),
+            **kwargs
+        )
+    
+    future = asyncio.get_running_loop().create_future()
+    await OUTBOUND_QUEUE.put((kwargs, future))
+    return await future
+
+
+async def start_outbound_workers(application):
+    """创建出站消息队列并启动发送任务"""
+    global OUTBOUND_QUEUE, OUTBOUND_WORKER_TASKS
+    OUTBOUND_QUEUE = asyncio.Queue(maxsize=OUTBOUND_QUEUE_SIZE)
+    OUTBOUND_WORKER_TASKS = [
+        asyncio.create_task(outbound_send_worker(application.bot, OUTBOUND_QUEUE))
+        for _ in range(OUTBOUND_WORKER_COUNT)
+    ]
+    logger.info(f"{OUTBOUND_WORKER_COUNT} outbound send workers started")
+
+
+async def stop_outbound_workers(application):
+    """停止发送任务，队列中未发送的消息均被取消"""
+    global OUTBOUND_QUEUE, OUTBOUND_WORKER_TASKS
+    for task in OUTBOUND_WORKER_TASKS:
+        task.cancel()
+    await asyncio.gather(*OUTBOUND_WORKER_TASKS, return_exceptions=True)
+    if OUTBOUND_QUEUE:
+        while not OUTBOUND_QUEUE.empty():
+            _, future = OUTBOUND_QUEUE.get_nowait()
+            future.cancel()
+    OUTBOUND_QUEUE = None
+    OUTBOUND_WORKER_TASKS = []
+    logger.info("Outbound send workers stopped")
+
+
+async def start_background_workers(application):
+    """post_init 回调：启动索引批量写入和出站消息发送的后台任务"""
+    await start_index_worker(application)
+    await start_outbound_workers(application)
+
+
+async def stop_background_workers(application):
+    """post_shutdown 回调：停止所有后台任务"""
+    await stop_outbound_workers(application)
+    await stop_index_worker(application)
+
+
+async def download_to_path(file, path: str):
+    """
+    将 Telegram 文件下载到指定路径。
+    下载目录在模块加载时已创建，仅当其在运行期间被删除时才重建并重试一次。
+    """
+    try:
+        await file.download_to_drive(path)
+    except FileNotFoundError:
+        logger.warning(f"Download directory missing, recreating: {IMAGE_DOWNLOAD_PATH}")
+        os.makedirs(IMAGE_DOWNLOAD_PATH, exist_ok=True)
+        await file.download_to_drive(path)
+
+
+def get_pending_count_after_index() -> int:
+    """
+    返回新图片建立索引后的待处理OCR数量。
+    缓存超过 PENDING_COUNT_TTL 秒时重新查询数据库，否则在缓存值上加一（刚加入的图片即为 pending 状态）。
+    """
+    now = monotonic()
+    if now - PENDING_COUNT_CACHE['timestamp'] > PENDING_COUNT_TTL:
+        PENDING_COUNT_CACHE['value'] = searcher.get_pending_ocr_count(OCR_MAX_RETRIES)
+        PENDING_COUNT_CACHE['timestamp'] = now
     else:
-        logger.info(f"Image count ({len(image_files)}) is below {max_count}. No archive needed.")
+        PENDING_COUNT_CACHE['value'] += 1
+    return PENDING_COUNT_CACHE['value']
+
+
+async def reply_duplicate_image(update: Update, context: ContextTypes.DEFAULT_TYPE, record: Dict):
+    """
+    回复用户图片已存在：有原消息ID时回复ID，否则发送已存储的图片及其详情。
+    
+    Args:
+        update: Telegram Update对象
+        context: Telegram Context对象
+        record: 已存在图片的记录（search_similar_images 结果格式）
+    """
+    current_message_id = update.message.message_id
+    existing_telegram_message_id_in_db = record.get('telegram_message_id')
+    
+    if existing_telegram_message_id_in_db:
+        await update.message.reply_text(f"此图片已存在。\n原消息ID: {existing_telegram_message_id_in_db}", reply_to_message_id=current_message_id)
+        logger.info(f"Duplicate image received, original telegram_message_id: {existing_telegram_message_id_in_db}")
+        return
+    
+    try:
+        photo_bytes = await read_file_bytes(record['path'])
+        caption = f"此图片已存在，但无原消息ID。\n{build_result_details(record)}"
+        await context.bot.send_photo(
+            chat_id=update.effective_chat.id,
+            photo=InputFile(photo_bytes),
+            caption=caption,
+            parse_mode='HTML',
+            reply_to_message_id=current_message_id
+        )
+        logger.info(f"Duplicate image received with no source message ID, sent details for {record['path']}")
+    except FileNotFoundError:
+        logger.warning(f"Existing file not found: {record['path']}. Cannot send to user.")
+        await update.message.reply_text("此图片已存在，但原始文件丢失。", reply_to_message_id=current_message_id)
+    except Exception as e:
+        logger.error(f"Error sending existing image details: {e}")
+        await update.message.reply_text("处理现有图片时发生错误。", reply_to_message_id=current_message_id)
 
 
 async def handle_photo_with_retry(update: Update, context: ContextTypes.DEFAULT_TYPE, max_retries: int = OCR_MAX_RETRIES) -> bool:
@@ -351,12 +946,14 @@ async def handle_photo_with_retry(update: Update, context: ContextTypes.DEFAULT_
     Returns:
         bool: 处理成功返回True，失败返回False
     """
-    photo = update.message.photo[-1] # Get the largest photo size
-    current_message_id = update.message.message_id # Bot's received message ID
+    msg = update.message
+    bot = context.bot
+    photo = msg.photo[-1] # Get the largest photo size
+    current_message_id = msg.message_id # Bot's received message ID
     
     # Extract original message ID for database storage if it's a forwarded channel message
     telegram_msg_id_for_db = ""
-    forward_origin = update.message.forward_origin
+    forward_origin = msg.forward_origin
     if isinstance(forward_origin, MessageOriginChannel):
         # Telegram channel usernames are unique, can form a direct link
         if forward_origin.chat.username:
@@ -367,21 +964,29 @@ async def handle_photo_with_retry(update: Update, context: ContextTypes.DEFAULT_
     else:
         logger.info("Message is not a forwarded channel message.")
 
+    is_search = bool(msg.caption) and msg.caption.strip().lower() == '/find'
+    
+    # 非搜索模式下，先通过 file_unique_id 查询是否为已索引的图片，命中则无需下载和计算哈希
+    if not is_search:
+        known_record = searcher.find_by_file_unique_id(photo.file_unique_id)
+        if known_record:
+            logger.info(f"Duplicate image detected by file_unique_id {photo.file_unique_id}, skipping download")
+            await reply_duplicate_image(update, context, known_record)
+            return True
+
     # Determine file extension
     file_ext = os.path.splitext(photo.file_unique_id)[1] or '.jpg'
     temp_save_path = None
     
     for attempt in range(max_retries + 1):  # +1 因为第一次不算重试
         try:
-            # 生成临时文件路径，确保文件夹存在
-            if not os.path.exists(IMAGE_DOWNLOAD_PATH):
-                os.makedirs(IMAGE_DOWNLOAD_PATH, exist_ok=True)
+            # 生成临时文件路径（下载目录在模块加载时已创建）
+            temp_save_path = f"{DOWNLOAD_PATH_PREFIX}temp_{uuid4()}{file_ext}"
             
-            temp_save_path = os.path.join(IMAGE_DOWNLOAD_PATH, f"temp_{uuid4()}{file_ext}")
-            
-            # 下载文件
-            file = await context.bot.get_file(photo.file_id)
-            await file.download_to_drive(temp_save_path)
+            # 下载文件（限制并发下载数量）
+            async with DOWNLOAD_SEM:
+                file = await bot.get_file(photo.file_id)
+                await download_to_path(file, temp_save_path)
             
             # 验证文件是否成功下载
             if not os.path.exists(temp_save_path) or os.path.getsize(temp_save_path) == 0:
@@ -390,60 +995,49 @@ async def handle_photo_with_retry(update: Update, context: ContextTypes.DEFAULT_
             logger.info(f"Downloaded photo to temporary path {temp_save_path} (attempt {attempt + 1})")
 
             # Check if the message caption contains the /find command
-            if update.message.caption and update.message.caption.strip().lower() == '/find':
+            if is_search:
                 # --- Execute search logic ---
                 await search_by_image(update, context, temp_save_path)
                 return True
             else:
                 # --- Execute add/deduplication logic ---
                 # 1. Check for exact duplicate first
+                # 先按文件MD5查找，命中时无需解码图片；未命中时再比对感知哈希（汉明距离为0同样视为重复）
                 exact_match_results = searcher.search_similar_images(temp_save_path, threshold=0, max_results=1)
                 
                 if exact_match_results and exact_match_results[0].get('similarity') == 1.0:
-                    exact_match_data = exact_match_results[0]
-                    existing_telegram_message_id_in_db = exact_match_data.get('telegram_message_id')
-                    
-                    if existing_telegram_message_id_in_db:
-                        await update.message.reply_text(f"此图片已存在。\n原消息ID: {existing_telegram_message_id_in_db}", reply_to_message_id=current_message_id)
-                        logger.info(f"Duplicate image received, original telegram_message_id: {existing_telegram_message_id_in_db}")
-                    else:
-                        try:
-                            with open(exact_match_data['path'], 'rb') as photo_file:
-                                caption = (f"此图片已存在，但无原消息ID。\n"
-                                           f"文件路径: `{os.path.basename(exact_match_data['path'])}`\n"
-                                           f"文件哈希: `{exact_match_data['file_hash']}`\n"
-                                           f"更新时间: {datetime.fromtimestamp(exact_match_data['updated_time']).strftime('%Y-%m-%d %H:%M:%S')}")
-                                await context.bot.send_photo(
-                                    chat_id=update.effective_chat.id,
-                                    photo=InputFile(photo_file),
-                                    caption=caption,
-                                    parse_mode='Markdown',
-                                    reply_to_message_id=current_message_id
-                                )
-                                logger.info(f"Duplicate image received with no source message ID, sent details for {exact_match_data['path']}")
-                        except FileNotFoundError:
-                            logger.warning(f"Existing file not found: {exact_match_data['path']}. Cannot send to user.")
-                            await update.message.reply_text("此图片已存在，但原始文件丢失。", reply_to_message_id=current_message_id)
-                        except Exception as e:
-                            logger.error(f"Error sending existing image details: {e}")
-                            await update.message.reply_text("处理现有图片时发生错误。", reply_to_message_id=current_message_id)
+                    await reply_duplicate_image(update, context, exact_match_results[0])
                 else:
                     # 2. If it's a new image, rename and add to index
-                    permanent_path = os.path.join(IMAGE_DOWNLOAD_PATH, f"{current_message_id}_{photo.file_unique_id}{file_ext}")
+                    permanent_name = f"{current_message_id}_{photo.file_unique_id}{file_ext}"
+                    permanent_path = f"{DOWNLOAD_PATH_PREFIX}{permanent_name}"
                     
+                    # 改名后到写入索引前，防止并发的归档把该文件移走（否则索引时找不到文件）
+                    INDEXING_FILE_NAMES.add(permanent_name)
                     try:
-                        os.rename(temp_save_path, permanent_path)
-                        temp_save_path = None  # Mark as None to prevent deletion in finally block
-                    except OSError as e:
-                        raise Exception(f"Failed to rename file {temp_save_path} to {permanent_path}: {e}")
-
-                    # Add image to index - now returns bool (True/False) instead of OCR text
-                    # OCR will be processed later by scheduled task
-                    index_success = searcher.add_image_to_index(permanent_path, telegram_msg_id_for_db)
+                        try:
+                            os.rename(temp_save_path, permanent_path)
+                            temp_save_path = None  # Mark as None to prevent deletion in finally block
+                            note_downloaded_image()
+                        except OSError as e:
+                            raise Exception(f"Failed to rename file {temp_save_path} to {permanent_path}: {e}")
+
+                        # Add image to index - now returns bool (True/False) instead of OCR text
+                        # OCR will be processed later by scheduled task
+                        # 与同时到达的其他图片合并为一个批次提交
+                        index_success = await index_image(permanent_path, telegram_msg_id_for_db, photo.file_unique_id)
+                        if not index_success:
+                            # 索引未写入（例如批次提交失败），删除已改名的文件，避免留下没有索引记录的图片，重试时会重新下载
+                            try:
+                                os.remove(permanent_path)
+                            except OSError as e:
+                                logger.warning(f"Failed to remove unindexed file {permanent_path}: {e}")
+                    finally:
+                        INDEXING_FILE_NAMES.discard(permanent_name)
                     if index_success:
-                        pending_count = searcher.get_pending_ocr_count(OCR_MAX_RETRIES)
-                        await update.message.reply_text(f"该图片已成功建立索引。\nOCR处理将在定时任务中进行。\n当前待处理OCR图片数: {pending_count}", 
-                                                        reply_to_message_id=current_message_id, parse_mode='Markdown')
+                        pending_count = get_pending_count_after_index()
+                        await msg.reply_text(f"该图片已成功建立索引。\nOCR处理将在定时任务中进行。\n当前待处理OCR图片数: {pending_count}", 
+                                             reply_to_message_id=current_message_id, parse_mode='Markdown')
                     else:
                         raise Exception("图片索引建立失败")
                     
@@ -471,7 +1065,7 @@ async def handle_photo_with_retry(update: Update, context: ContextTypes.DEFAULT_
             else:
                 # 已达到最大重试次数，放弃处理
                 logger.error(f"Failed to handle photo after {max_retries + 1} attempts with message_id {current_message_id}")
-                await update.message.reply_text(
+                await msg.reply_text(
                     f"图片处理失败（已重试{max_retries}次）。\n请检查日志或稍后重试。", 
                     reply_to_message_id=current_message_id
                 )
@@ -527,13 +1121,15 @@ async def search_by_image(update: Update, context: ContextTypes.DEFAULT_TYPE, qu
     如果完全匹配但无原消息ID，则发送图片和详细信息。
     否则，发送所有相似结果。
     """
+    msg = update.message
+    bot = context.bot
     try:
         # search_similar_images returns a list of dicts, sorted by similarity descending.
         # An exact match (similarity 1.0) would be the first item if found.
         results = searcher.search_similar_images(query_image_path)
         
         if not results:
-            await update.message.reply_text("未找到匹配结果。", reply_to_message_id=update.message.message_id)
+            await msg.reply_text("未找到匹配结果。", reply_to_message_id=msg.message_id)
             return
 
         first_result = results[0]
@@ -543,38 +1139,35 @@ async def search_by_image(update: Update, context: ContextTypes.DEFAULT_TYPE, qu
             
             if existing_telegram_message_id_in_db:
                 # Case 1: Found exact match with a stored original message ID.
-                await update.message.reply_text(f"找到完全匹配的结果。\n原消息ID: {existing_telegram_message_id_in_db}", 
-                                                reply_to_message_id=update.message.message_id)
+                await msg.reply_text(f"找到完全匹配的结果。\n原消息ID: {existing_telegram_message_id_in_db}", 
+                                     reply_to_message_id=msg.message_id)
                 return
             else:
                 # Case 2: Found exact match but no original message ID. Send the image with details.
                 try:
                     if not os.path.exists(first_result['path']):
                         logger.warning(f"Exact match file not found: {first_result['path']}.")
-                        await update.message.reply_text("找到完全匹配的结果，但原始文件丢失。", reply_to_message_id=update.message.message_id)
+                        await msg.reply_text("找到完全匹配的结果，但原始文件丢失。", reply_to_message_id=msg.message_id)
                         return
                     
-                    with open(first_result['path'], 'rb') as photo_file:
-                        caption = (f"找到完全匹配的结果，但无原消息ID。\n"
-                                   f"文件路径: `{os.path.basename(first_result['path'])}`\n"
-                                   f"文件哈希: `{first_result['file_hash']}`\n"
-                                   f"更新时间: {datetime.fromtimestamp(first_result['updated_time']).strftime('%Y-%m-%d %H:%M:%S')}")
-                        await context.bot.send_photo(
-                            chat_id=update.effective_chat.id,
-                            photo=InputFile(photo_file),
-                            caption=caption,
-                            parse_mode='Markdown',
-                            reply_to_message_id=update.message.message_id
-                        )
+                    photo_bytes = await read_file_bytes(first_result['path'])
+                    caption = f"找到完全匹配的结果，但无原消息ID。\n{build_result_details(first_result)}"
+                    await bot.send_photo(
+                        chat_id=update.effective_chat.id,
+                        photo=InputFile(photo_bytes),
+                        caption=caption,
+                        parse_mode='HTML',
+                        reply_to_message_id=msg.message_id
+                    )
                     logger.info(f"Sent exact match image details for {first_result['path']}")
                     return
                 except IOError as e:
                     logger.error(f"IO error reading exact match file {first_result['path']}: {e}")
-                    await update.message.reply_text("读取文件时发生错误。", reply_to_message_id=update.message.message_id)
+                    await msg.reply_text("读取文件时发生错误。", reply_to_message_id=msg.message_id)
                     return
                 except Exception as e:
                     logger.error(f"Error sending exact match image details: {e}")
-                    await update.message.reply_text("处理完全匹配图片时发生错误。", reply_to_message_id=update.message.message_id)
+                    await msg.reply_text("处理完全匹配图片时发生错误。", reply_to_message_id=msg.message_id)
                     return
             
         # If we reach here, it means there was no exact match (similarity < 1.0)
@@ -592,52 +1185,48 @@ async def search_by_image(update: Update, context: ContextTypes.DEFAULT_TYPE, qu
             await render_find_page(update, context, query_id, 1, is_callback=False)
             return
 
-        await update.message.reply_text(f"未找到完全匹配的结果，以下是 {len(results)} 个相似结果:",
-                                        reply_to_message_id=update.message.message_id)
+        await msg.reply_text(f"未找到完全匹配的结果，以下是 {len(results)} 个相似结果:",
+                             reply_to_message_id=msg.message_id)
 
-        for result in results:
-            try:
-                if not os.path.exists(result['path']):
-                    logger.warning(f"Search result file not found: {result['path']}.")
-                    await update.message.reply_text(f"无法发送结果，文件已不存在: `{os.path.basename(result['path'])}`", 
-                                                    reply_to_message_id=update.message.message_id, parse_mode='Markdown')
-                    continue
-                
-                with open(result['path'], 'rb') as photo_file:
-                    caption_parts = []
-                    if result.get('telegram_message_id'):
-                        caption_parts.append(f"原消息ID: {result['telegram_message_id']}")
-                    
-                    caption_parts.append(f"文件路径: `{os.path.basename(result['path'])}`")
-                    caption_parts.append(f"文件哈希: `{result['file_hash']}`")
-                    caption_parts.append(f"更新时间: {datetime.fromtimestamp(result['updated_time']).strftime('%Y-%m-%d %H:%M:%S')}")
-                    if 'similarity' in result:
-                        caption_parts.append(f"相似度: {result['similarity']:.2%}")
-                    if 'ocr_text' in result and result['ocr_text']:
-                        display_ocr_text = result['ocr_text'][:100] + "..." if len(result['ocr_text']) > 100 else result['ocr_text']
-                        caption_parts.append(f"OCR文本: `{display_ocr_text}`")
+        async def send_result(result: Dict):
+            # 文件名中可能包含 HTML 特殊字符，预先转义
+            file_name = html.escape(os.path.basename(result['path']))
+            async with SEND_SEM:
+                try:
+                    if not os.path.exists(result['path']):
+                        logger.warning(f"Search result file not found: {result['path']}.")
+                        await msg.reply_text(f"无法发送结果，文件已不存在: <code>{file_name}</code>", 
+                                             reply_to_message_id=msg.message_id, parse_mode='HTML')
+                        return
                     
-                    caption = "\n".join(caption_parts)
+                    photo_bytes = await read_file_bytes(result['path'])
+                    caption = build_result_caption(result)
                     
-                    await context.bot.send_photo(
+                    await bot.send_photo(
                         chat_id=update.effective_chat.id,
-                        photo=InputFile(photo_file),
+                        photo=InputFile(photo_bytes),
                         caption=caption,
-                        parse_mode='Markdown',
-                        reply_to_message_id=update.message.message_id
+                        parse_mode='HTML',
+                        reply_to_message_id=msg.message_id
                     )
-            except IOError as e:
-                logger.error(f"IO error reading search result file {result['path']}: {e}")
-                await update.message.reply_text(f"读取文件时发生错误: `{os.path.basename(result['path'])}`", 
-                                                reply_to_message_id=update.message.message_id, parse_mode='Markdown')
-            except Exception as e:
-                logger.error(f"Failed to send search result photo {result['path']}: {e}")
-                await update.message.reply_text(f"发送搜索结果图片时发生错误: `{os.path.basename(result['path'])}`", 
-                                                reply_to_message_id=update.message.message_id, parse_mode='Markdown')
+                except IOError as e:
+                    logger.error(f"IO error reading search result file {result['path']}: {e}")
+                    await msg.reply_text(f"读取文件时发生错误: <code>{file_name}</code>", 
+                                         reply_to_message_id=msg.message_id, parse_mode='HTML')
+                except Exception as e:
+                    logger.error(f"Failed to send search result photo {result['path']}: {e}")
+                    await msg.reply_text(f"发送搜索结果图片时发生错误: <code>{file_name}</code>", 
+                                         reply_to_message_id=msg.message_id, parse_mode='HTML')
+
+        # 并发发送所有结果（并发数由 SEND_SEM 限制），而不是逐条等待
+        send_outcomes = await asyncio.gather(*(send_result(result) for result in results), return_exceptions=True)
+        for result, outcome in zip(results, send_outcomes):
+            if isinstance(outcome, Exception):
+                logger.error(f"Failed to deliver search result {result['path']}: {outcome}")
     
     except Exception as e:
         logger.error(f"Unexpected error in search_by_image: {e}", exc_info=True)
-        await update.message.reply_text("搜索时发生意外错误。", reply_to_message_id=update.message.message_id)
+        await msg.reply_text("搜索时发生意外错误。", reply_to_message_id=msg.message_id)
 
 
 async def find_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -652,15 +1241,16 @@ async def find_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if update.message.reply_to_message and update.message.reply_to_message.photo:
         photo = update.message.reply_to_message.photo[-1]
         file_ext = os.path.splitext(photo.file_unique_id)[1] or '.jpg'
-        temp_file_path = os.path.join(IMAGE_DOWNLOAD_PATH, f"temp_search_{uuid4()}{file_ext}")
+        temp_file_path = None
         try:
-            if not os.path.exists(IMAGE_DOWNLOAD_PATH):
-                os.makedirs(IMAGE_DOWNLOAD_PATH, exist_ok=True)
+            # 由 tempfile 原子地创建唯一的临时文件（O_EXCL），下载时直接覆盖写入
+            with tempfile.NamedTemporaryFile(prefix='temp_search_', suffix=file_ext, dir=IMAGE_DOWNLOAD_PATH, delete=False) as temp_file:
+                temp_file_path = temp_file.name
             
             file = await context.bot.get_file(photo.file_id)
             await file.download_to_drive(temp_file_path)
             
-            if not os.path.exists(temp_file_path) or os.path.getsize(temp_file_path) == 0:
+            if os.path.getsize(temp_file_path) == 0:
                 logger.error(f"Downloaded file is empty or doesn't exist: {temp_file_path}")
                 await update.message.reply_text("下载文件失败，文件为空。", reply_to_message_id=update.message.message_id)
                 return
@@ -673,7 +1263,7 @@ async def find_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
             logger.error(f"Error processing search via replied photo: {e}", exc_info=True)
             await update.message.reply_text("通过回复图片搜索时发生错误。", reply_to_message_id=update.message.message_id)
         finally:
-            if os.path.exists(temp_file_path):
+            if temp_file_path and os.path.exists(temp_file_path):
                 try:
                     os.remove(temp_file_path)
                     logger.info(f"Cleaned up temporary search file: {temp_file_path}")
@@ -686,51 +1276,34 @@ async def find_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
             # 解析搜索参数
             search_mode = 'exact'  # 默认模式：精确匹配（不分词）
             max_results = MAX_RESULTS  # 默认结果数
-            keywords_args = list(context.args)
             
-            # 解析参数
-            i = 0
-            while i < len(keywords_args):
-                arg = keywords_args[i]
-                if arg.startswith('--'):
-                    param = arg[2:]  # 移除 '--'
+            # 解析参数：单次遍历，匹配的参数设置模式/结果数，其余作为关键词
+            keywords_args = []
+            for arg in context.args:
+                match = FIND_ARG_PATTERN.match(arg)
+                count_str, mode = match.groups() if match else (None, None)
+                if mode:
                     # 支持 --com 作为 --comprehensive 的别名
-                    if param == 'com':
-                        param = 'comprehensive'
-                    if param in ['exact', 'comprehensive', 'contains']:
-                        search_mode = param
-                        keywords_args.pop(i)
-                        continue
-                    else:
-                        await update.message.reply_text(
-                            f"无效的搜索模式: {arg}\n"
-                            f"支持的模式: --exact (默认), --comprehensive (--com), --contains",
-                            reply_to_message_id=update.message.message_id
-                        )
-                        return
-                elif arg.startswith('-n=') or arg.startswith('--max=') or (arg.startswith('-') and arg[1:].isdigit()):
+                    search_mode = 'comprehensive' if mode == 'com' else mode
+                elif count_str and int(count_str) > 0:
                     # 解析结果数参数，支持 -n=5, --max=5, -5 三种格式
-                    try:
-                        if arg.startswith('-n='):
-                            max_results = int(arg[3:])
-                        elif arg.startswith('--max='):
-                            max_results = int(arg[6:])
-                        elif arg.startswith('-') and arg[1:].isdigit():
-                            # 支持 -5 这种简化格式
-                            max_results = int(arg[1:])
-                        
-                        if max_results <= 0:
-                            raise ValueError("结果数必须大于0")
-                        keywords_args.pop(i)
-                        continue
-                    except ValueError as e:
-                        await update.message.reply_text(
-                            f"无效的结果数参数: {arg}\n"
-                            f"请使用 -数字, -n=数字 或 --max=数字 格式，如 -5 或 -n=5",
-                            reply_to_message_id=update.message.message_id
-                        )
-                        return
-                i += 1
+                    max_results = int(count_str)
+                elif match or arg.startswith('-n=') or arg.startswith('--max='):
+                    await update.message.reply_text(
+                        f"无效的结果数参数: {arg}\n"
+                        f"请使用 -数字, -n=数字 或 --max=数字 格式，如 -5 或 -n=5",
+                        reply_to_message_id=update.message.message_id
+                    )
+                    return
+                elif arg.startswith('--'):
+                    await update.message.reply_text(
+                        f"无效的搜索模式: {arg}\n"
+                        f"支持的模式: --exact (默认), --comprehensive (--com), --contains",
+                        reply_to_message_id=update.message.message_id
+                    )
+                    return
+                else:
+                    keywords_args.append(arg)
             
             keywords = " ".join(keywords_args)
             if not keywords.strip():
@@ -771,19 +1344,20 @@ async def find_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
                     await update.message.reply_text(message, reply_to_message_id=update.message.message_id, parse_mode='HTML')
                 else:
                     filename = os.path.basename(result['path'])
-                    message = f"找到1个文本匹配结果 ({mode_desc}模式)，文件路径：<code>{filename}</code>"
+                    message = f"找到1个文本匹配结果 ({mode_desc}模式)，文件路径：<code>{html.escape(filename)}</code>"
                     await update.message.reply_text(message, reply_to_message_id=update.message.message_id, parse_mode='HTML')
 
                     # 发送图片文件
                     try:
                         if os.path.exists(result['path']):
-                            with open(result['path'], 'rb') as photo:
-                                await context.bot.send_photo(
-                                    chat_id=update.effective_chat.id,
-                                    photo=InputFile(photo, filename=filename),
-                                    caption=f"📁 {filename}",
-                                    reply_to_message_id=update.message.message_id
-                                )
+                            photo_bytes = await read_file_bytes(result['path'])
+                            await context.bot.send_photo(
+                                chat_id=update.effective_chat.id,
+                                photo=photo_bytes,
+                                filename=filename,
+                                caption=f"📁 {filename}",
+                                reply_to_message_id=update.message.message_id
+                            )
                     except Exception as e:
                         logger.error(f"发送搜索结果图片失败: {e}")
                         await update.message.reply_text(f"发送图片失败: {filename}")
@@ -820,11 +1394,10 @@ async def find_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
                 # 处理有消息ID的结果 - 合并为一条消息
                 if with_message_id:
-                    message_lines = []
-                    for idx, result in enumerate(with_message_id, 1):
-                        message_lines.append(f"{idx}. 原消息ID：{result['telegram_message_id']}")
-
-                    combined_message = "\n".join(message_lines)
+                    combined_message = "\n".join(
+                        f"{idx}. 原消息ID：{result['telegram_message_id']}"
+                        for idx, result in enumerate(with_message_id, 1)
+                    )
                     await context.bot.send_message(
                         chat_id=update.effective_chat.id,
                         text=combined_message,
@@ -832,41 +1405,56 @@ async def find_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
                     )
 
                 # 处理没有消息ID的结果 - 单条发送并附带图片
-                for idx, result in enumerate(without_message_id, len(with_message_id) + 1):
-                    filename = os.path.basename(result['path'])
-                    await context.bot.send_message(
-                        chat_id=update.effective_chat.id,
-                        text=f"{idx}. 文件路径：<code>{filename}</code>",
-                        parse_mode='HTML'
-                    )
+                # 用 TaskGroup 并发发送（最多5个同时进行），缩短多结果时的总耗时
+                send_sem = asyncio.Semaphore(5)
+                # 预先批量计算文件名，发送和失败提示共用
+                filenames = list(map(os.path.basename, (result['path'] for result in without_message_id)))
+                failed_filenames = []
+                # 按目录批量检查文件是否存在（目录扫描会阻塞，放到工作线程中执行）
+                existing_paths = await asyncio.to_thread(
+                    get_existing_paths, [result['path'] for result in without_message_id]
+                )
 
-                    # 发送图片文件
+                async def send_one(idx: int, result: Dict, filename: str):
+                    # 每个任务自行捕获异常，避免一个结果失败导致 TaskGroup 取消其余发送
                     try:
-                        if os.path.exists(result['path']):
-                            with open(result['path'], 'rb') as photo:
+                        async with send_sem:
+                            await context.bot.send_message(
+                                chat_id=update.effective_chat.id,
+                                text=f"{idx}. 文件路径：<code>{html.escape(filename)}</code>",
+                                parse_mode='HTML'
+                            )
+
+                            # 发送图片文件
+                            if result['path'] in existing_paths:
+                                photo_bytes = await read_file_bytes(result['path'])
                                 await context.bot.send_photo(
                                     chat_id=update.effective_chat.id,
-                                    photo=InputFile(photo, filename=filename),
+                                    photo=photo_bytes,
+                                    filename=filename,
                                     caption=f"📁 {filename}"
                                 )
                     except Exception as e:
-                        logger.error(f"发送搜索结果图片失败: {e}")
-                        await context.bot.send_message(
-                            chat_id=update.effective_chat.id,
-                            text=f"⚠️ 发送图片失败: {filename}"
-                        )
+                        logger.error(f"发送搜索结果图片失败 {filename}: {e}")
+                        failed_filenames.append(filename)
+
+                async with asyncio.TaskGroup() as tg:
+                    for idx, (result, filename) in enumerate(zip(without_message_id, filenames), len(with_message_id) + 1):
+                        tg.create_task(send_one(idx, result, filename))
+
+                # 失败的图片汇总为一条提示
+                if failed_filenames:
+                    await context.bot.send_message(
+                        chat_id=update.effective_chat.id,
+                        text="⚠️ 发送图片失败:\n" + "\n".join(failed_filenames)
+                    )
         except Exception as e:
             logger.error(f"Error during text search: {e}", exc_info=True)
             await update.message.reply_text("文本搜索时发生错误。", reply_to_message_id=update.message.message_id)
     
     # Invalid usage of /find command
     else:
-        help_text = """使用方法：
-1. <code>/find &lt;关键词&gt;</code> (精确匹配，不分词)
-2. <code>/find --comprehensive &lt;关键词&gt;</code> 或 <code>/find --com &lt;关键词&gt;</code> (全面搜索，包含分词)
-3. <code>/find --contains &lt;关键词&gt;</code> (内存遍历搜索，最准确)
-4. 回复一张图片并发送 <code>/find</code> (图片搜索)"""
-        await update.message.reply_text(help_text, parse_mode='HTML', reply_to_message_id=update.message.message_id)
+        await update.message.reply_text(FIND_HELP_TEXT, parse_mode='HTML', reply_to_message_id=update.message.message_id)
 
 
 async def handle_find_page_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -894,12 +1482,104 @@ async def handle_find_page_callback(update: Update, context: ContextTypes.DEFAUL
     await render_find_page(update, context, query_id, page, is_callback=True)
 
 
-async def ocr_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """
-    处理 /ocr 命令，立即对所有未OCR的图片进行OCR处理
+def get_peak_rss_kb() -> Optional[int]:
+    """返回当前进程的峰值常驻内存（KB），平台不支持时返回 None"""
+    if resource is None:
+        return None
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS 上 ru_maxrss 的单位是字节，Linux 上是 KB
+    if sys.platform == 'darwin':
+        peak_rss //= 1024
+    return peak_rss
 
-    与定时任务不同的是，/ocr 会一次性处理所有待处理的图片，
-    不受 OCR_BATCH_SIZE 的限制（但内存允许的情况下）
+
+async def run_ocr_batch(**kwargs) -> Dict:
+    """
+    在 OCR 专用线程池中运行一批 OCR（参数传给 process_ocr_pending_images），超过 OCR_BATCH_TIMEOUT 秒抛出 asyncio.TimeoutError。
+    线程无法被强制终止，超时的批次会在原线程中继续运行到结束，
+    因此超时后换用新的线程池，之后的批次（包括 /ocr）不会排在它后面一直等待。
+    """
+    global OCR_EXECUTOR
+    executor = OCR_EXECUTOR
+    loop = asyncio.get_running_loop()
+    try:
+        return await asyncio.wait_for(
+            loop.run_in_executor(executor, partial(searcher.process_ocr_pending_images, **kwargs)),
+            timeout=OCR_BATCH_TIMEOUT
+        )
+    except asyncio.TimeoutError:
+        if OCR_EXECUTOR is executor:
+            OCR_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ocr")
+            executor.shutdown(wait=False)
+        raise
+
+
+def post_ocr_progress(progress_queue: asyncio.Queue, processed: Optional[int]):
+    """
+    向进度队列投递最新的已处理数量（None 表示结束）。
+    队列已满时丢弃尚未显示的旧进度，只保留最新值。
+    """
+    try:
+        progress_queue.put_nowait(processed)
+    except asyncio.QueueFull:
+        progress_queue.get_nowait()
+        progress_queue.put_nowait(processed)
+
+
+async def ocr_progress_updater(progress_queue: asyncio.Queue, bot, chat_id: int, message_id: int,
+                               pending_count: int, start_time: float):
+    """
+    后台任务：从队列读取OCR进度并编辑进度消息。
+    两次编辑至少间隔 0.5 秒，等待期间到达的进度只显示最新值，收到 None 时退出。
+    """
+    last_update_time = -math.inf
+    last_shown_processed = -1
+    while True:
+        processed = await progress_queue.get()
+        if processed is None:
+            return
+        
+        wait = 0.5 - (monotonic() - last_update_time)
+        if wait > 0:
+            await asyncio.sleep(wait)
+            # 等待期间可能有更新的进度，取最新值
+            if not progress_queue.empty():
+                processed = progress_queue.get_nowait()
+                if processed is None:
+                    return
+        
+        # 进度没有变化时不再编辑消息（也避免 Telegram 返回 "message is not modified"）
+        if processed == last_shown_processed:
+            continue
+        
+        now = monotonic()
+        try:
+            # 计算当前耗时
+            elapsed_str = f"{int(now - start_time)}s"
+            
+            progress_text = (
+                f"⏳ 正在处理 {pending_count} 张待OCR的图片\n\n"
+                f"{create_progress_bar(processed, pending_count)}\n"
+                f"{processed}/{pending_count} 张已处理\n\n"
+                f"⏱️ 已用时: {elapsed_str}"
+            )
+            await bot.edit_message_text(
+                chat_id=chat_id,
+                message_id=message_id,
+                text=progress_text
+            )
+            last_update_time = now
+            last_shown_processed = processed
+        except Exception as e:
+            logger.debug(f"Failed to update progress message: {e}")
+
+
+async def ocr_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    处理 /ocr 命令，立即对所有未OCR的图片进行OCR处理
+
+    与定时任务不同的是，/ocr 会一次性处理所有待处理的图片，
+    不受 OCR_BATCH_SIZE 的限制（但内存允许的情况下）
     """
     import gc
     
@@ -925,68 +1605,67 @@ async def ocr_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         # 关键改进：循环处理所有待处理图片，直到完成，并实时更新进度条
         total_stats = {'processed': 0, 'succeeded': 0, 'failed': 0, 'skipped': 0}
         iteration = 0
-        max_iterations = 100  # 防止无限循环的安全阈值
-        start_time = datetime.now()  # 记录开始时间，用于计算总耗时
-        last_update_time = start_time  # 记录上次更新时间，避免过于频繁的 API 调用
+        # 防止无限循环的安全阈值，按待处理数量和批大小估算（预留一倍余量），至少10次
+        max_iterations = max(10, (pending_count // max(1, OCR_BATCH_SIZE)) * 2)
+        start_time = monotonic()  # 记录开始时间，用于计算总耗时
+        remaining = pending_count  # 剩余待处理数量，由每批处理结果返回，无需每轮单独查询
+        base_rss = get_peak_rss_kb()  # 上次垃圾回收时的峰值内存
         
-        while iteration < max_iterations:
-            iteration += 1
-            remaining = searcher.get_pending_ocr_count(OCR_MAX_RETRIES)
-            if remaining == 0:
-                logger.info(f"Force OCR: All images processed after {iteration} iterations.")
-                break
-            
-            logger.info(f"Force OCR iteration {iteration}: Processing {remaining} pending images...")
-            # Run blocking OCR task in a separate thread
-            loop = asyncio.get_running_loop()
-            stats = await loop.run_in_executor(
-                None, 
-                lambda: searcher.process_ocr_pending_images(batch_size=OCR_BATCH_SIZE, max_retries=OCR_MAX_RETRIES)
-            )
-            
-            # 累计统计
-            total_stats['processed'] += stats['processed']
-            total_stats['succeeded'] += stats['succeeded']
-            total_stats['failed'] += stats['failed']
-            total_stats['skipped'] += stats['skipped']
-            
-            # 每处理完一批后，更新进度条（为避免 API 限流，只在有意义的进度时更新，最多每 0.5 秒更新一次）
-            now = datetime.now()
-            if (now - last_update_time).total_seconds() >= 0.5 or remaining == 0:
+        # 进度条由单独的后台任务限速更新，队列只保留最新进度
+        progress_queue = asyncio.Queue(maxsize=1)
+        updater_task = asyncio.create_task(ocr_progress_updater(
+            progress_queue, context.bot, update.effective_chat.id, status_message.message_id, pending_count, start_time
+        ))
+        
+        try:
+            while iteration < max_iterations:
+                iteration += 1
+                
+                logger.info(f"Force OCR iteration {iteration}: Processing {remaining} pending images...")
+                # Run blocking OCR task in a separate thread
                 try:
-                    # 计算当前耗时
-                    elapsed = now - start_time
-                    elapsed_str = f"{int(elapsed.total_seconds())}s"
-                    
-                    progress_text = (
-                        f"⏳ 正在处理 {pending_count} 张待OCR的图片\n\n"
-                        f"{create_progress_bar(total_stats['processed'], pending_count)}\n"
-                        f"{total_stats['processed']}/{pending_count} 张已处理\n\n"
-                        f"⏱️ 已用时: {elapsed_str}"
-                    )
-                    await context.bot.edit_message_text(
-                        chat_id=update.effective_chat.id,
-                        message_id=status_message.message_id,
-                        text=progress_text
-                    )
-                    last_update_time = now
-                except Exception as e:
-                    logger.debug(f"Failed to update progress message: {e}")
-            
-            # 如果本轮没有处理任何图片，说明都是失败的，避免无限循环
-            if stats['processed'] == 0:
-                logger.warning(f"No images were processed in iteration {iteration}, stopping.")
-                break
-            
-            # 每批次处理后显式触发垃圾回收，及时释放内存
-            # 注意：OCR引擎采用懒加载模式，每批处理完会自动清理，下次需要时自动加载
-            gc.collect()
+                    stats = await run_ocr_batch(batch_size=OCR_BATCH_SIZE, max_retries=OCR_MAX_RETRIES)
+                except asyncio.TimeoutError:
+                    logger.error(f"Force OCR batch processing timeout in iteration {iteration}, stopping.")
+                    break
+                remaining = stats.get('remaining', 0)
+                
+                # 累计统计
+                total_stats['processed'] += stats['processed']
+                total_stats['succeeded'] += stats['succeeded']
+                total_stats['failed'] += stats['failed']
+                total_stats['skipped'] += stats['skipped']
+                
+                # 每处理完一批后，将最新进度交给后台任务更新进度条，不等待 Telegram API
+                # 全部处理完成时不再更新进度条，由循环结束后的最终消息一次性展示结果
+                if remaining != 0:
+                    post_ocr_progress(progress_queue, total_stats['processed'])
+                
+                # 如果本轮没有处理任何图片，说明都是失败的，避免无限循环
+                if stats['processed'] == 0:
+                    logger.warning(f"No images were processed in iteration {iteration}, stopping.")
+                    break
+                
+                if remaining == 0:
+                    logger.info(f"Force OCR: All images processed after {iteration} iterations.")
+                    break
+                
+                # 每隔几批检查一次内存，只有内存明显增长时才触发垃圾回收（完整回收本身有不小的CPU开销）
+                # 注意：OCR引擎采用懒加载模式，每批处理完会自动清理，下次需要时自动加载
+                if iteration % GC_CHECK_INTERVAL == 0:
+                    current_rss = get_peak_rss_kb()
+                    if current_rss is None or current_rss - base_rss > GC_RSS_GROWTH_KB:
+                        gc.collect()
+                        base_rss = current_rss
+        finally:
+            # 通知后台任务退出并等待其结束，之后再编辑最终结果消息
+            post_ocr_progress(progress_queue, None)
+            await updater_task
         
         # 计算总耗时
-        end_time = datetime.now()
-        total_elapsed = end_time - start_time
-        elapsed_minutes = int(total_elapsed.total_seconds() // 60)
-        elapsed_seconds = int(total_elapsed.total_seconds() % 60)
+        total_elapsed = monotonic() - start_time
+        elapsed_minutes = int(total_elapsed // 60)
+        elapsed_seconds = int(total_elapsed % 60)
         total_time_str = f"{elapsed_minutes}m {elapsed_seconds}s" if elapsed_minutes > 0 else f"{elapsed_seconds}s"
         
         # 构建详细的反馈消息
@@ -1046,356 +1725,265 @@ async def ocr_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.message.reply_text(error_message)
 
 
-async def tag_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def resolve_replied_photo_record(update: Update, context: ContextTypes.DEFAULT_TYPE, action_desc: str) -> Optional[Dict]:
     """
-    处理 /tag 命令，手动设置OCR结果。
-    命令用法：回复一张图片并发送 "/tag 文本内容"
-    例如：/tag 猫 薛条 可爱
-    """
-    logger.info(f"🏷️ Received /tag command from user {update.message.from_user.id}")
-    
-    if update.message.from_user.id != ALLOWED_USER_ID:
-        logger.warning(f"❌ Unauthorized user {update.message.from_user.id} tried to interact with /tag.")
-        return
-    
-    # 检查是否回复了一个消息
-    if not update.message.reply_to_message:
-        await update.message.reply_text(
-            "请回复一个包含图片的消息并使用 /tag 命令。\n\n"
-            "用法：回复图片后发送 `/tag 文本内容`",
-            parse_mode='Markdown',
-            reply_to_message_id=update.message.message_id
-        )
-        return
+    查找被回复图片在数据库中的记录。
+    依次尝试：按 file_unique_id 查询 -> 按消息ID文件名查询 -> 缓存的 file_hash 查询 -> 下载图片并按特征查找。
+    未找到或下载失败时会直接回复用户并返回 None。
     
-    # 检查回复的消息是否包含图片
+    Args:
+        update: Telegram Update对象
+        context: Telegram Context对象
+        action_desc: 用于错误提示的操作描述，例如 "设置OCR"
+        
+    Returns:
+        Optional[Dict]: 图片记录（search_similar_images 结果格式）
+    """
     replied_message = update.message.reply_to_message
-    if not replied_message.photo:
+    photo = replied_message.photo[-1]
+    file_unique_id = photo.file_unique_id
+    
+    record = searcher.find_by_file_unique_id(file_unique_id)
+    if record:
+        return record
+    
+    # 机器人保存的图片以 "{消息ID}_{file_unique_id}" 命名，回复的正是当初收到的消息时可直接命中
+    record = searcher.find_by_file_name_prefix(f"{replied_message.message_id}_{file_unique_id}")
+    if record:
+        return record
+    
+    cached_hash = REPLIED_PHOTO_HASH_CACHE.get(file_unique_id)
+    if cached_hash:
+        record = searcher.find_by_hash(cached_hash)
+        if record:
+            REPLIED_PHOTO_HASH_CACHE.move_to_end(file_unique_id)
+            return record
+        # 记录已不存在，丢弃缓存
+        del REPLIED_PHOTO_HASH_CACHE[file_unique_id]
+    
+    # 图片直接下载到内存中查找，无需临时文件
+    buffer = io.BytesIO()
+    file = await context.bot.get_file(photo.file_id)
+    await file.download_to_memory(buffer)
+    image_bytes = buffer.getvalue()
+    
+    if not image_bytes:
+        logger.error(f"Downloaded photo {file_unique_id} is empty")
         await update.message.reply_text(
-            "请回复一个包含图片的消息。",
+            f"下载图片失败，无法{action_desc}。",
             reply_to_message_id=update.message.message_id
         )
-        return
+        return None
     
-    # 获取OCR文本内容
-    if not context.args:
+    # 通过图片特征查找数据库中的记录（图片解码和特征计算会阻塞，放到线程池中执行）
+    similar_results = await asyncio.to_thread(
+        searcher.search_similar_images_from_bytes, image_bytes, threshold=0, max_results=1
+    )
+    
+    if not similar_results or similar_results[0].get('similarity') != 1.0:
         await update.message.reply_text(
-            "请提供OCR文本内容。\n\n"
-            "用法：`/tag 文本内容`",
-            parse_mode='Markdown',
+            "未在数据库中找到该图片的记录。\n\n"
+            "请确认该图片已经被索引。",
             reply_to_message_id=update.message.message_id
         )
-        return
+        return None
     
-    # 连接所有参数作为OCR文本
-    ocr_text = " ".join(context.args)
+    record = similar_results[0]
+    REPLIED_PHOTO_HASH_CACHE[file_unique_id] = record['file_hash']
+    if len(REPLIED_PHOTO_HASH_CACHE) > REPLIED_PHOTO_CACHE_SIZE:
+        REPLIED_PHOTO_HASH_CACHE.popitem(last=False)
+    return record
+
+
+def requires_replied_photo_record(command: str, action_desc: str, no_reply_text: str,
+                                  no_reply_parse_mode: Optional[str] = None,
+                                  missing_args_text: Optional[str] = None):
+    """
+    回复图片类命令的装饰器：统一处理权限检查、回复消息/图片检查、参数检查、
+    查找被回复图片的数据库记录以及异常处理，找到记录后以 record 参数调用被装饰的处理函数。
     
-    try:
-        # 获取回复消息的Telegram消息ID
-        replied_message_id = replied_message.message_id
-        
-        # 构造数据库中的telegram_message_id
-        # 需要查找数据库中相应的记录，可能需要通过图片特征查找
-        
-        # 首先下载图片并获取其特征
-        photo = replied_message.photo[-1]
-        file_ext = os.path.splitext(photo.file_unique_id)[1] or '.jpg'
-        temp_file_path = os.path.join(IMAGE_DOWNLOAD_PATH, f"temp_setocr_{uuid4()}{file_ext}")
-        
-        try:
-            if not os.path.exists(IMAGE_DOWNLOAD_PATH):
-                os.makedirs(IMAGE_DOWNLOAD_PATH, exist_ok=True)
-            
-            file = await context.bot.get_file(photo.file_id)
-            await file.download_to_drive(temp_file_path)
+    Args:
+        command: 命令名（不含斜杠），用于日志和错误提示
+        action_desc: 操作描述，用于下载失败时的提示，例如 "设置OCR"
+        no_reply_text: 未回复任何消息时的提示文本
+        no_reply_parse_mode: no_reply_text 的解析模式
+        missing_args_text: 命令需要参数时，缺少参数的提示文本（Markdown），None 表示不需要参数
+    """
+    def decorator(handler):
+        @wraps(handler)
+        async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE):
+            if update.message.from_user.id != ALLOWED_USER_ID:
+                logger.warning(f"❌ Unauthorized user {update.message.from_user.id} tried to interact with /{command}.")
+                return
             
-            if not os.path.exists(temp_file_path) or os.path.getsize(temp_file_path) == 0:
-                logger.error(f"Downloaded file is empty or doesn't exist: {temp_file_path}")
+            # 检查是否回复了一个消息
+            if not update.message.reply_to_message:
                 await update.message.reply_text(
-                    "下载图片失败，无法设置OCR。",
+                    no_reply_text,
+                    parse_mode=no_reply_parse_mode,
                     reply_to_message_id=update.message.message_id
                 )
                 return
             
-            # 通过图片特征查找数据库中的记录
-            similar_results = searcher.search_similar_images(temp_file_path, threshold=0, max_results=1)
-            
-            if not similar_results or similar_results[0].get('similarity') != 1.0:
+            # 检查回复的消息是否包含图片
+            if not update.message.reply_to_message.photo:
                 await update.message.reply_text(
-                    "未在数据库中找到该图片的记录。\n\n"
-                    "请确认该图片已经被索引。",
+                    "请回复一个包含图片的消息。",
                     reply_to_message_id=update.message.message_id
                 )
                 return
             
-            # 获取图片的file_hash和telegram_message_id
-            image_record = similar_results[0]
-            file_hash = image_record.get('file_hash')
-            telegram_message_id_in_db = image_record.get('telegram_message_id')
-            
-            # 通过file_hash设置OCR结果（支持没有message_id的图片）
-            success = searcher.set_manual_ocr_result_by_hash(file_hash, ocr_text)
-            
-            if success:
-                pending_count = searcher.get_pending_ocr_count(OCR_MAX_RETRIES)
-                msg_info = f"消息ID: {telegram_message_id_in_db}" if telegram_message_id_in_db else "(无消息ID)"
-                # 使用 HTML 格式避免 Markdown 特殊字符解析问题
-                import html
-                escaped_ocr_text = html.escape(ocr_text)
+            # 检查参数（在下载图片之前）
+            if missing_args_text and not context.args:
                 await update.message.reply_text(
-                    f"✅ OCR结果已成功设置。\n\n"
-                    f"OCR内容: <code>{escaped_ocr_text}</code>\n"
-                    f"{msg_info}\n"
-                    f"当前待处理OCR图片数: {pending_count}",
-                    parse_mode='HTML',
+                    missing_args_text,
+                    parse_mode='Markdown',
                     reply_to_message_id=update.message.message_id
                 )
-                logger.info(f"User manually set OCR result for file_hash {file_hash}: '{ocr_text}'")
-            else:
+                return
+            
+            try:
+                # 查找被回复图片在数据库中的记录（未找到时已回复用户）
+                record = await resolve_replied_photo_record(update, context, action_desc)
+                if not record:
+                    return
+                await handler(update, context, record)
+            except Exception as e:
+                logger.error(f"Error in {handler.__name__}: {e}", exc_info=True)
                 await update.message.reply_text(
-                    "❌ 设置OCR结果失败，请检查日志。",
+                    f"处理/{command}命令时发生错误，请检查日志。",
                     reply_to_message_id=update.message.message_id
                 )
-        
-        finally:
-            # 清理临时文件
-            if os.path.exists(temp_file_path):
-                try:
-                    os.remove(temp_file_path)
-                    logger.info(f"Cleaned up temporary file: {temp_file_path}")
-                except OSError as e:
-                    logger.error(f"Failed to clean up temporary file {temp_file_path}: {e}")
+        return wrapper
+    return decorator
+
+
+@requires_replied_photo_record(
+    'tag', '设置OCR',
+    "请回复一个包含图片的消息并使用 /tag 命令。\n\n"
+    "用法：回复图片后发送 `/tag 文本内容`",
+    no_reply_parse_mode='Markdown',
+    missing_args_text="请提供OCR文本内容。\n\n"
+                      "用法：`/tag 文本内容`"
+)
+async def tag_command(update: Update, context: ContextTypes.DEFAULT_TYPE, image_record: Dict):
+    """
+    处理 /tag 命令，手动设置OCR结果。
+    命令用法：回复一张图片并发送 "/tag 文本内容"
+    例如：/tag 猫 薛条 可爱
+    """
+    logger.info(f"🏷️ Received /tag command from user {update.message.from_user.id}")
     
-    except Exception as e:
-        logger.error(f"Error in tag_command: {e}", exc_info=True)
+    # 连接所有参数作为OCR文本
+    ocr_text = " ".join(context.args)
+    
+    # 获取图片的file_hash和telegram_message_id
+    file_hash = image_record.get('file_hash')
+    telegram_message_id_in_db = image_record.get('telegram_message_id')
+    
+    # 通过file_hash设置OCR结果（支持没有message_id的图片）
+    success = searcher.set_manual_ocr_result_by_hash(file_hash, ocr_text)
+    
+    if success:
+        pending_count = searcher.get_pending_ocr_count(OCR_MAX_RETRIES)
+        msg_info = f"消息ID: {telegram_message_id_in_db}" if telegram_message_id_in_db else "(无消息ID)"
+        # 使用 HTML 格式避免 Markdown 特殊字符解析问题
+        escaped_ocr_text = html.escape(ocr_text)
         await update.message.reply_text(
-            "处理/tag命令时发生错误，请检查日志。",
+            f"✅ OCR结果已成功设置。\n\n"
+            f"OCR内容: <code>{escaped_ocr_text}</code>\n"
+            f"{msg_info}\n"
+            f"当前待处理OCR图片数: {pending_count}",
+            parse_mode='HTML',
+            reply_to_message_id=update.message.message_id
+        )
+        logger.info(f"User manually set OCR result for file_hash {file_hash}: '{ocr_text}'")
+    else:
+        await update.message.reply_text(
+            "❌ 设置OCR结果失败，请检查日志。",
             reply_to_message_id=update.message.message_id
         )
 
 
-async def setmessageid_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+@requires_replied_photo_record(
+    'link', '设置消息ID',
+    "请回复一个包含图片的消息并使用 /link 命令。\n\n"
+    "用法：回复图片后发送 `/link <消息ID或链接>`",
+    no_reply_parse_mode='Markdown',
+    missing_args_text="请提供消息ID或链接。\n\n"
+                      "用法：`/link <消息ID或链接>`"
+)
+async def setmessageid_command(update: Update, context: ContextTypes.DEFAULT_TYPE, image_record: Dict):
     """
     处理 /link 命令，为图片设置Telegram消息ID。
     命令用法：回复一张图片并发送 "/link <消息ID或链接>"
     例如：/link https://t.me/channel/12345
     """
-    if update.message.from_user.id != ALLOWED_USER_ID:
-        logger.warning(f"Unauthorized user {update.message.from_user.id} tried to interact with /link.")
-        return
+    # 连接所有参数作为消息ID
+    message_id = " ".join(context.args)
     
-    # 检查是否回复了一个消息
-    if not update.message.reply_to_message:
-        await update.message.reply_text(
-            "请回复一个包含图片的消息并使用 /link 命令。\n\n"
-            "用法：回复图片后发送 `/link <消息ID或链接>`",
-            parse_mode='Markdown',
-            reply_to_message_id=update.message.message_id
-        )
-        return
+    # 获取图片信息
+    file_hash = image_record.get('file_hash')
+    existing_message_id = image_record.get('telegram_message_id')
     
-    # 检查回复的消息是否包含图片
-    replied_message = update.message.reply_to_message
-    if not replied_message.photo:
+    # 检查是否已有消息ID
+    if existing_message_id:
         await update.message.reply_text(
-            "请回复一个包含图片的消息。",
+            f"该图片已有消息ID：{existing_message_id}\n\n"
+            f"无法覆盖已存在的消息ID。",
             reply_to_message_id=update.message.message_id
         )
         return
     
-    # 获取消息ID
-    if not context.args:
+    # 设置消息ID
+    success = searcher.set_message_id_by_hash(file_hash, message_id)
+    
+    if success:
         await update.message.reply_text(
-            "请提供消息ID或链接。\n\n"
-            "用法：`/link <消息ID或链接>`",
+            f"✅ 消息ID已成功设置。\n\n"
+            f"消息ID: `{message_id}`",
             parse_mode='Markdown',
             reply_to_message_id=update.message.message_id
         )
-        return
-    
-    # 连接所有参数作为消息ID
-    message_id = " ".join(context.args)
-    
-    try:
-        # 下载图片并获取其特征
-        photo = replied_message.photo[-1]
-        file_ext = os.path.splitext(photo.file_unique_id)[1] or '.jpg'
-        temp_file_path = os.path.join(IMAGE_DOWNLOAD_PATH, f"temp_setmsgid_{uuid4()}{file_ext}")
-        
-        try:
-            if not os.path.exists(IMAGE_DOWNLOAD_PATH):
-                os.makedirs(IMAGE_DOWNLOAD_PATH, exist_ok=True)
-            
-            file = await context.bot.get_file(photo.file_id)
-            await file.download_to_drive(temp_file_path)
-            
-            if not os.path.exists(temp_file_path) or os.path.getsize(temp_file_path) == 0:
-                logger.error(f"Downloaded file is empty or doesn't exist: {temp_file_path}")
-                await update.message.reply_text(
-                    "下载图片失败，无法设置消息ID。",
-                    reply_to_message_id=update.message.message_id
-                )
-                return
-            
-            # 通过图片特征查找数据库中的记录
-            similar_results = searcher.search_similar_images(temp_file_path, threshold=0, max_results=1)
-            
-            if not similar_results or similar_results[0].get('similarity') != 1.0:
-                await update.message.reply_text(
-                    "未在数据库中找到该图片的记录。\n\n"
-                    "请确认该图片已经被索引。",
-                    reply_to_message_id=update.message.message_id
-                )
-                return
-            
-            # 获取图片信息
-            image_record = similar_results[0]
-            file_hash = image_record.get('file_hash')
-            existing_message_id = image_record.get('telegram_message_id')
-            
-            # 检查是否已有消息ID
-            if existing_message_id:
-                await update.message.reply_text(
-                    f"该图片已有消息ID：{existing_message_id}\n\n"
-                    f"无法覆盖已存在的消息ID。",
-                    reply_to_message_id=update.message.message_id
-                )
-                return
-            
-            # 设置消息ID
-            success = searcher.set_message_id_by_hash(file_hash, message_id)
-            
-            if success:
-                await update.message.reply_text(
-                    f"✅ 消息ID已成功设置。\n\n"
-                    f"消息ID: `{message_id}`",
-                    parse_mode='Markdown',
-                    reply_to_message_id=update.message.message_id
-                )
-                logger.info(f"User manually set message_id for file_hash {file_hash}: '{message_id}'")
-            else:
-                await update.message.reply_text(
-                    "❌ 设置消息ID失败，请检查日志。",
-                    reply_to_message_id=update.message.message_id
-                )
-        
-        finally:
-            # 清理临时文件
-            if os.path.exists(temp_file_path):
-                try:
-                    os.remove(temp_file_path)
-                    logger.info(f"Cleaned up temporary file: {temp_file_path}")
-                except OSError as e:
-                    logger.error(f"Failed to clean up temporary file {temp_file_path}: {e}")
-    
-    except Exception as e:
-        logger.error(f"Error in setmessageid_command: {e}", exc_info=True)
+        logger.info(f"User manually set message_id for file_hash {file_hash}: '{message_id}'")
+    else:
         await update.message.reply_text(
-            "处理/link命令时发生错误，请检查日志。",
+            "❌ 设置消息ID失败，请检查日志。",
             reply_to_message_id=update.message.message_id
         )
 
 
-async def untag_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+@requires_replied_photo_record('untag', '清除OCR', "请回复一个包含图片的消息并使用 /untag 命令。")
+async def untag_command(update: Update, context: ContextTypes.DEFAULT_TYPE, image_record: Dict):
     """
     处理 /untag 命令，清除OCR结果。
     命令用法：回复一张图片并发送 "/untag"
     """
-    if update.message.from_user.id != ALLOWED_USER_ID:
-        logger.warning(f"Unauthorized user {update.message.from_user.id} tried to interact with /untag.")
-        return
+    # 获取图片的telegram_message_id
+    telegram_message_id_in_db = image_record.get('telegram_message_id')
     
-    # 检查是否回复了一个消息
-    if not update.message.reply_to_message:
+    if not telegram_message_id_in_db:
         await update.message.reply_text(
-            "请回复一个包含图片的消息并使用 /untag 命令。",
+            "该图片没有对应的Telegram消息ID，无法清除OCR。",
             reply_to_message_id=update.message.message_id
         )
         return
     
-    # 检查回复的消息是否包含图片
-    replied_message = update.message.reply_to_message
-    if not replied_message.photo:
+    # 清除OCR结果
+    success = searcher.clear_ocr_result(telegram_message_id_in_db)
+    
+    if success:
+        pending_count = searcher.get_pending_ocr_count(OCR_MAX_RETRIES)
         await update.message.reply_text(
-            "请回复一个包含图片的消息。",
+            f"✅ OCR结果已成功清除。\n\n"
+            f"该图片的OCR状态已重置为pending。\n"
+            f"当前待处理OCR图片数: {pending_count}",
             reply_to_message_id=update.message.message_id
         )
-        return
-    
-    try:
-        # 下载图片并获取其特征
-        photo = replied_message.photo[-1]
-        file_ext = os.path.splitext(photo.file_unique_id)[1] or '.jpg'
-        temp_file_path = os.path.join(IMAGE_DOWNLOAD_PATH, f"temp_clearocr_{uuid4()}{file_ext}")
-        
-        try:
-            if not os.path.exists(IMAGE_DOWNLOAD_PATH):
-                os.makedirs(IMAGE_DOWNLOAD_PATH, exist_ok=True)
-            
-            file = await context.bot.get_file(photo.file_id)
-            await file.download_to_drive(temp_file_path)
-            
-            if not os.path.exists(temp_file_path) or os.path.getsize(temp_file_path) == 0:
-                logger.error(f"Downloaded file is empty or doesn't exist: {temp_file_path}")
-                await update.message.reply_text(
-                    "下载图片失败，无法清除OCR。",
-                    reply_to_message_id=update.message.message_id
-                )
-                return
-            
-            # 通过图片特征查找数据库中的记录
-            similar_results = searcher.search_similar_images(temp_file_path, threshold=0, max_results=1)
-            
-            if not similar_results or similar_results[0].get('similarity') != 1.0:
-                await update.message.reply_text(
-                    "未在数据库中找到该图片的记录。\n\n"
-                    "请确认该图片已经被索引。",
-                    reply_to_message_id=update.message.message_id
-                )
-                return
-            
-            # 获取图片的telegram_message_id
-            image_record = similar_results[0]
-            telegram_message_id_in_db = image_record.get('telegram_message_id')
-            
-            if not telegram_message_id_in_db:
-                await update.message.reply_text(
-                    "该图片没有对应的Telegram消息ID，无法清除OCR。",
-                    reply_to_message_id=update.message.message_id
-                )
-                return
-            
-            # 清除OCR结果
-            success = searcher.clear_ocr_result(telegram_message_id_in_db)
-            
-            if success:
-                pending_count = searcher.get_pending_ocr_count(OCR_MAX_RETRIES)
-                await update.message.reply_text(
-                    f"✅ OCR结果已成功清除。\n\n"
-                    f"该图片的OCR状态已重置为pending。\n"
-                    f"当前待处理OCR图片数: {pending_count}",
-                    reply_to_message_id=update.message.message_id
-                )
-                logger.info(f"User manually cleared OCR result for message_id {telegram_message_id_in_db}")
-            else:
-                await update.message.reply_text(
-                    "❌ 清除OCR结果失败，请检查日志。",
-                    reply_to_message_id=update.message.message_id
-                )
-        
-        finally:
-            # 清理临时文件
-            if os.path.exists(temp_file_path):
-                try:
-                    os.remove(temp_file_path)
-                    logger.info(f"Cleaned up temporary file: {temp_file_path}")
-                except OSError as e:
-                    logger.error(f"Failed to clean up temporary file {temp_file_path}: {e}")
-    
-    except Exception as e:
-        logger.error(f"Error in untag_command: {e}", exc_info=True)
+        logger.info(f"User manually cleared OCR result for message_id {telegram_message_id_in_db}")
+    else:
         await update.message.reply_text(
-            "处理/untag命令时发生错误，请检查日志。",
+            "❌ 清除OCR结果失败，请检查日志。",
             reply_to_message_id=update.message.message_id
         )
 
@@ -1457,92 +2045,34 @@ async def getocr_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     # 模式2: 回复消息查询
-    # 检查是否回复了一个消息
-    if not update.message.reply_to_message:
-        await update.message.reply_text(
-            "请使用以下方式之一：\n"
-            "1. 回复一张图片并发送 /getocr\n"
-            "2. 使用 /getocr -l <消息ID>",
-            reply_to_message_id=update.message.message_id
-        )
-        return
+    await getocr_reply_command(update, context)
+
+
+@requires_replied_photo_record(
+    'getocr', '查询OCR',
+    "请使用以下方式之一：\n"
+    "1. 回复一张图片并发送 /getocr\n"
+    "2. 使用 /getocr -l <消息ID>"
+)
+async def getocr_reply_command(update: Update, context: ContextTypes.DEFAULT_TYPE, image_record: Dict):
+    """/getocr 模式2：查询被回复图片的OCR结果"""
+    ocr_text = image_record.get('ocr_text', '')
     
-    # 检查回复的消息是否包含图片
-    replied_message = update.message.reply_to_message
-    if not replied_message.photo:
+    # 检查OCR结果
+    if not ocr_text or ocr_text.strip() == '':
         await update.message.reply_text(
-            "请回复一个包含图片的消息。",
+            "❌ 该图片没有OCR结果。",
             reply_to_message_id=update.message.message_id
         )
-        return
-    
-    try:
-        # 下载图片并获取其特征
-        photo = replied_message.photo[-1]
-        file_ext = os.path.splitext(photo.file_unique_id)[1] or '.jpg'
-        temp_file_path = os.path.join(IMAGE_DOWNLOAD_PATH, f"temp_getocr_{uuid4()}{file_ext}")
-        
-        try:
-            if not os.path.exists(IMAGE_DOWNLOAD_PATH):
-                os.makedirs(IMAGE_DOWNLOAD_PATH, exist_ok=True)
-            
-            file = await context.bot.get_file(photo.file_id)
-            await file.download_to_drive(temp_file_path)
-            
-            if not os.path.exists(temp_file_path) or os.path.getsize(temp_file_path) == 0:
-                logger.error(f"Downloaded file is empty or doesn't exist: {temp_file_path}")
-                await update.message.reply_text(
-                    "下载图片失败，无法查询OCR。",
-                    reply_to_message_id=update.message.message_id
-                )
-                return
-            
-            # 通过图片特征查找数据库中的记录
-            similar_results = searcher.search_similar_images(temp_file_path, threshold=0, max_results=1)
-            
-            if not similar_results or similar_results[0].get('similarity') != 1.0:
-                await update.message.reply_text(
-                    "未在数据库中找到该图片的记录。\n\n"
-                    "请确认该图片已经被索引。",
-                    reply_to_message_id=update.message.message_id
-                )
-                return
-            
-            # 获取图片记录
-            image_record = similar_results[0]
-            ocr_text = image_record.get('ocr_text', '')
-            
-            # 检查OCR结果
-            if not ocr_text or ocr_text.strip() == '':
-                await update.message.reply_text(
-                    "❌ 该图片没有OCR结果。",
-                    reply_to_message_id=update.message.message_id
-                )
-            else:
-                # 返回OCR结果
-                response = f"✅ OCR结果：\n\n`{ocr_text}`"
-                await update.message.reply_text(
-                    response,
-                    parse_mode='Markdown',
-                    reply_to_message_id=update.message.message_id
-                )
-                logger.info(f"User queried OCR result: '{ocr_text[:50]}...'")
-        
-        finally:
-            # 清理临时文件
-            if os.path.exists(temp_file_path):
-                try:
-                    os.remove(temp_file_path)
-                    logger.info(f"Cleaned up temporary file: {temp_file_path}")
-                except OSError as e:
-                    logger.error(f"Failed to clean up temporary file {temp_file_path}: {e}")
-    
-    except Exception as e:
-        logger.error(f"Error in getocr_command: {e}", exc_info=True)
+    else:
+        # 返回OCR结果
+        response = f"✅ OCR结果：\n\n`{ocr_text}`"
         await update.message.reply_text(
-            "处理/getocr命令时发生错误，请检查日志。",
+            response,
+            parse_mode='Markdown',
             reply_to_message_id=update.message.message_id
         )
+        logger.info(f"User queried OCR result: '{ocr_text[:50]}...'")
 
 
 async def failed_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -1562,6 +2092,11 @@ async def failed_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         logger.warning(f"❌ Unauthorized user {update.message.from_user.id} tried to interact with /failed.")
         return
     
+    # 本命令的所有消息都经出站队列统一限流、重试后发送
+    bot = context.bot
+    chat_id = update.effective_chat.id
+    send = partial(send_queued_message, bot, chat_id=chat_id)
+    
     # 解析参数
     limit = FAILED_OCR_DEFAULT_LIMIT  # 默认值
     show_all = False
@@ -1580,53 +2115,27 @@ async def failed_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     failed_count = searcher.get_failed_ocr_count()
     
     if failed_count == 0:
-        await update.message.reply_text(
-            "✅ 当前没有OCR失败的记录。",
-            reply_to_message_id=update.message.message_id
-        )
+        await send(text="✅ 当前没有OCR失败的记录。", reply_to_message_id=update.message.message_id)
         return
     
-    # 获取失败记录
-    records = searcher.get_failed_ocr_records(limit=limit if not show_all else None)
+    # 要显示的记录数由总数推算，记录本身在发送时逐页读取，无需先全部加载
+    shown_count = failed_count if show_all else min(limit, failed_count)
     
-    if not records:
-        await update.message.reply_text(
-            "✅ 当前没有OCR失败的记录。",
-            reply_to_message_id=update.message.message_id
-        )
+    if shown_count == 0:
+        await send(text="✅ 当前没有OCR失败的记录。", reply_to_message_id=update.message.message_id)
         return
     
     # 先发送概要信息
     if show_all:
-        summary = f"📋 OCR失败记录（全部 {len(records)} 条）\n\n以下将逐条显示，点击引用可跳转到对应图片："
+        summary = f"📋 OCR失败记录（全部 {shown_count} 条）\n\n点击引用可跳转到对应图片："
     else:
-        summary = f"📋 OCR失败记录（显示 {len(records)}/{failed_count} 条）\n\n以下将逐条显示，点击引用可跳转到对应图片："
+        summary = f"📋 OCR失败记录（显示 {shown_count}/{failed_count} 条）\n\n点击引用可跳转到对应图片："
     
-    await update.message.reply_text(
-        summary,
-        reply_to_message_id=update.message.message_id
-    )
-    
-    # 逐条发送，通过回复历史消息的方式
-    sent_count = 0
-    skipped_count = 0
+    await send(text=summary, reply_to_message_id=update.message.message_id)
     
-    for idx, record in enumerate(records, 1):
-        file_name = os.path.basename(record['file_path'])
-        fail_count = record['ocr_fail_count']
-        
-        # 从文件名中提取消息ID（格式: {message_id}_{file_unique_id}.{ext}）
-        msg_id_from_filename = None
-        if '_' in file_name:
-            parts = file_name.split('_')
-            if parts[0].isdigit():
-                msg_id_from_filename = int(parts[0])
-        
-        # 更新时间格式化
-        update_time = ""
-        if record['updated_time']:
-            update_time = datetime.fromtimestamp(record['updated_time']).strftime('%m-%d %H:%M')
-        
+    async def send_linked(entry: Tuple) -> Tuple[int, int, int]:
+        """回复原图片消息发送单条失败记录，返回 (已显示数, 无法定位数, 跳过数)"""
+        idx, file_name, fail_count, update_time, msg_id_from_filename = entry
         # 构建消息内容
         message_text = (
             f"⚠️ 失败记录 #{idx}\n"
@@ -1634,46 +2143,101 @@ async def failed_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
             f"更新时间: {update_time}\n"
             f"💡 回复此图片使用 /tag 设置标签"
         )
+        try:
+            # 通过回复历史消息发送，用户点击引用即可跳转
+            await send(text=message_text, reply_to_message_id=msg_id_from_filename)
+            return 1, 0, 0
+        except Exception as e:
+            # 如果回复失败（比如原消息已被删除），记录跳过
+            logger.warning(f"Failed to reply to message {msg_id_from_filename}: {e}")
+            return 0, 0, 1
+    
+    async def send_orphans(lines: List[str]) -> Tuple[int, int, int]:
+        """将无法定位原消息的多条失败记录合并为一条消息发送，返回 (已显示数, 无法定位数, 跳过数)"""
+        await send(text=FAILED_ORPHAN_HEADER + "\n".join(lines), parse_mode='HTML')
+        return len(lines), len(lines), 0
+    
+    totals = Counter()
+    pending_sends = set()
+    
+    def collect_outcomes(tasks):
+        """累计已完成发送任务的结果"""
+        for task in tasks:
+            if task.exception() is not None:
+                logger.error(f"Failed to send failed OCR record: {task.exception()}")
+                continue
+            shown, orphans, skipped = task.result()
+            totals['sent'] += shown
+            totals['orphan'] += orphans
+            totals['skipped'] += skipped
+    
+    async def start_send(coro):
+        """启动一个发送任务；在途任务达到 FAILED_SEND_MAX_PENDING 时先等待其中的任务完成，读取记录不会远远领先于发送"""
+        nonlocal pending_sends
+        if len(pending_sends) >= FAILED_SEND_MAX_PENDING:
+            done, pending_sends = await asyncio.wait(pending_sends, return_when=asyncio.FIRST_COMPLETED)
+            collect_outcomes(done)
+        pending_sends.add(asyncio.create_task(coro))
+    
+    # 边读取边发送：能定位原消息的逐条回复（点击引用跳转），
+    # 无法定位的攒够一组（且不超过单条消息长度上限）后合并发送
+    orphan_lines = []
+    orphan_length = len(FAILED_ORPHAN_HEADER)
+    records = searcher.iter_failed_ocr_records(
+        limit=None if show_all else limit,
+        columns=('file_name', 'ocr_fail_count', 'updated_time')
+    )
+    for idx, record in enumerate(records, 1):
+        file_name = record['file_name']
+        
+        # 从文件名中提取消息ID（格式: {message_id}_{file_unique_id}.{ext}）
+        msg_id_match = MSG_ID_PATTERN.match(file_name)
+        msg_id_from_filename = int(msg_id_match.group(1)) if msg_id_match else None
+        
+        # 更新时间格式化
+        update_time = ""
+        if record['updated_time']:
+            update_time = format_timestamp_minute(int(record['updated_time']) // 60)
         
         if msg_id_from_filename:
-            try:
-                # 通过回复历史消息发送，用户点击引用即可跳转
-                await context.bot.send_message(
-                    chat_id=update.effective_chat.id,
-                    text=message_text,
-                    reply_to_message_id=msg_id_from_filename
-                )
-                sent_count += 1
-                
-                # 添加短暂延迟，避免发送过快被限流
-                if idx < len(records):
-                    await asyncio.sleep(0.3)
-                    
-            except Exception as e:
-                # 如果回复失败（比如原消息已被删除），记录跳过
-                logger.warning(f"Failed to reply to message {msg_id_from_filename}: {e}")
-                skipped_count += 1
+            entry = (idx, file_name, record['ocr_fail_count'], update_time, msg_id_from_filename)
+            await start_send(send_linked(entry))
         else:
-            # 没有消息ID，直接发送文件名信息
-            await context.bot.send_message(
-                chat_id=update.effective_chat.id,
-                text=f"⚠️ 失败记录 #{idx}\n文件: `{file_name}`\n失败次数: {fail_count}\n更新时间: {update_time}\n⚠️ 无法定位原消息",
-                parse_mode='Markdown'
-            )
-            sent_count += 1
-            skipped_count += 1
-    
-    # 发送完成统计
+            line = f"#{idx} <code>{html.escape(file_name)}</code>\n失败次数: {record['ocr_fail_count']} | 更新时间: {update_time}"
+            # 加入本条会超出消息长度上限时，先发送已攒的记录
+            if orphan_lines and orphan_length + 1 + len(line) > TELEGRAM_MESSAGE_MAX_LENGTH:
+                await start_send(send_orphans(orphan_lines))
+                orphan_lines = []
+                orphan_length = len(FAILED_ORPHAN_HEADER)
+            orphan_lines.append(line)
+            orphan_length += len(line) + 1
+            if len(orphan_lines) < FAILED_ORPHAN_CHUNK_SIZE:
+                continue
+            await start_send(send_orphans(orphan_lines))
+            orphan_lines = []
+            orphan_length = len(FAILED_ORPHAN_HEADER)
+        # 让出事件循环，已创建的发送任务可以在继续读取记录的同时开始发送
+        await asyncio.sleep(0)
+    if orphan_lines:
+        await start_send(send_orphans(orphan_lines))
+    
+    if pending_sends:
+        done, _ = await asyncio.wait(pending_sends)
+        collect_outcomes(done)
+    sent_count = totals['sent']
+    orphan_count = totals['orphan']
+    skipped_count = totals['skipped']
+    
+    # 发送完成统计（无法定位原消息的记录已合并显示，计入已显示数；回复失败的记录未显示）
     complete_msg = f"✅ 已显示 {sent_count} 条失败记录"
+    if orphan_count > 0:
+        complete_msg += f"\n⚠️ 其中 {orphan_count} 条无法定位原消息"
     if skipped_count > 0:
-        complete_msg += f"\n⚠️ {skipped_count} 条无法定位原消息"
-    if not show_all and failed_count > len(records):
+        complete_msg += f"\n⚠️ {skipped_count} 条原消息已不存在，未能显示"
+    if not show_all and failed_count > shown_count:
         complete_msg += f"\n📌 使用 /failed -a 查看全部 {failed_count} 条记录"
     
-    await context.bot.send_message(
-        chat_id=update.effective_chat.id,
-        text=complete_msg
-    )
+    await send(text=complete_msg)
 
 
 async def scheduled_ocr_task(context: ContextTypes.DEFAULT_TYPE):
@@ -1685,23 +2249,20 @@ async def scheduled_ocr_task(context: ContextTypes.DEFAULT_TYPE):
     
     修复：添加超时保护和完善的错误处理，防止任务卡死导致程序无响应
     """
-    import gc
-    from concurrent.futures import ThreadPoolExecutor
-    
-    task_start_time = datetime.now()
+    bot = context.bot
+    task_start_time = datetime.now()  # 仅用于显示
+    task_start_monotonic = monotonic()  # 用于计算耗时，不受系统时钟调整影响
     logger.info(f"Scheduled OCR task started at: {task_start_time.strftime('%Y-%m-%d %H:%M:%S')}")
     
-    # 创建专用的线程池执行器，确保可以正确清理
-    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ocr_scheduled")
-    
     # 定义网络操作超时时间（秒）
     NETWORK_TIMEOUT = 30.0
+    send_admin = partial(send_queued_message, bot, chat_id=ALLOWED_USER_ID)
     
     async def safe_send_message(text: str) -> bool:
         """带超时保护的消息发送"""
         try:
             await asyncio.wait_for(
-                context.bot.send_message(chat_id=ALLOWED_USER_ID, text=text),
+                send_admin(text=text),
                 timeout=NETWORK_TIMEOUT
             )
             return True
@@ -1713,7 +2274,7 @@ async def scheduled_ocr_task(context: ContextTypes.DEFAULT_TYPE):
             return False
     
     try:
-        pending_count = searcher.get_pending_ocr_count(OCR_MAX_RETRIES)
+        pending_count = searcher.get_pending_ocr_count(OCR_MAX_RETRIES, OCR_RETRY_BASE_INTERVAL)
         if pending_count == 0:
             logger.info("Scheduled OCR task: No pending images.")
             await safe_send_message(
@@ -1724,58 +2285,60 @@ async def scheduled_ocr_task(context: ContextTypes.DEFAULT_TYPE):
         logger.info(f"Starting scheduled OCR task for {pending_count} images...")
         
         # 关键改进：循环处理，直到没有待处理的图片
-        total_stats = {'processed': 0, 'succeeded': 0, 'failed': 0, 'skipped': 0}
+        total_stats = Counter(processed=0, succeeded=0, failed=0, skipped=0)
         iteration = 0
         max_iterations = 100  # 添加最大迭代次数防护
+        remaining = pending_count
         
         while iteration < max_iterations:
             iteration += 1
-            remaining = searcher.get_pending_ocr_count(OCR_MAX_RETRIES)
-            if remaining == 0:
-                logger.info(f"All pending images have been processed after {iteration} iterations.")
-                break
-            
             logger.info(f"OCR task iteration {iteration}: Processing {remaining} pending images...")
             
             # 使用专用执行器运行阻塞的 OCR 任务
-            loop = asyncio.get_running_loop()
             try:
                 # 添加超时保护：每批次最多处理 10 分钟
-                stats = await asyncio.wait_for(
-                    loop.run_in_executor(
-                        executor, 
-                        lambda: searcher.process_ocr_pending_images(batch_size=OCR_BATCH_SIZE, max_retries=OCR_MAX_RETRIES)
-                    ),
-                    timeout=600.0  # 10 分钟超时
+                stats = await run_ocr_batch(
+                    batch_size=OCR_BATCH_SIZE,
+                    max_retries=OCR_MAX_RETRIES,
+                    count_remaining=(iteration % OCR_RECOUNT_INTERVAL == 0),
+                    retry_base_interval=OCR_RETRY_BASE_INTERVAL
                 )
             except asyncio.TimeoutError:
                 logger.error(f"OCR batch processing timeout in iteration {iteration}")
                 total_stats['failed'] += OCR_BATCH_SIZE  # 估算失败数量
                 break
             
+            # 剩余数量按本批结果推算（启用退避时，刚失败的图片在退避时间内不会再被处理；
+            # 未启用时在重试上限内仍会待处理），每 OCR_RECOUNT_INTERVAL 轮由数据库重新统计一次进行校正
+            counted_remaining = stats.pop('remaining', None)
+            if counted_remaining is not None:
+                remaining = counted_remaining
+            else:
+                settled = stats['succeeded'] + stats['skipped']
+                if OCR_RETRY_BASE_INTERVAL > 0:
+                    settled += stats['failed']
+                remaining = max(0, remaining - settled)
+            
             # 累计统计
-            total_stats['processed'] += stats['processed']
-            total_stats['succeeded'] += stats['succeeded']
-            total_stats['failed'] += stats['failed']
-            total_stats['skipped'] += stats['skipped']
+            total_stats.update(stats)
             
             # 如果本轮没有处理任何图片，说明都是失败的，避免无限循环
             if stats['processed'] == 0:
                 logger.warning(f"No images were processed in iteration {iteration}, stopping to avoid infinite loop.")
                 break
             
-            logger.info(f"Iteration {iteration} completed: {stats}")
+            logger.info(f"Iteration {iteration} completed: {stats}, remaining: {remaining}")
             
-            # 每批次处理后显式触发垃圾回收
-            gc.collect()
+            if remaining == 0:
+                logger.info(f"All pending images have been processed after {iteration} iterations.")
+                break
             
             # 添加心跳日志，证明程序仍在运行
             logger.info(f"💓 Heartbeat: OCR task still running after iteration {iteration}")
         
         # 计算任务耗时
         task_end_time = datetime.now()
-        task_duration = task_end_time - task_start_time
-        duration_str = f"{int(task_duration.total_seconds())}s"
+        duration_str = f"{int(monotonic() - task_start_monotonic)}s"
         
         # 发送完整的统计信息
         message = (
@@ -1802,8 +2365,7 @@ async def scheduled_ocr_task(context: ContextTypes.DEFAULT_TYPE):
         logger.info(f"Scheduled OCR task completed successfully: {total_stats}, iterations: {iteration}, duration: {duration_str}")
         
     except Exception as e:
-        task_duration = datetime.now() - task_start_time
-        duration_str = f"{int(task_duration.total_seconds())}s"
+        duration_str = f"{int(monotonic() - task_start_monotonic)}s"
         
         logger.error(f"Error in scheduled OCR task: {e}", exc_info=True)
         
@@ -1817,42 +2379,20 @@ async def scheduled_ocr_task(context: ContextTypes.DEFAULT_TYPE):
         await safe_send_message(error_message)
         
     finally:
-        # 关键修复：确保执行器被正确关闭，释放线程资源
-        try:
-            executor.shutdown(wait=False, cancel_futures=True)
-            logger.info("OCR executor shutdown completed")
-        except Exception as e:
-            logger.error(f"Error shutting down executor: {e}")
-        
-        # 最终垃圾回收
-        gc.collect()
-        
         # 确保记录任务结束，无论成功还是失败
-        task_end_time = datetime.now()
-        total_duration = (task_end_time - task_start_time).total_seconds()
+        total_duration = monotonic() - task_start_monotonic
         logger.info(f"🏁 Scheduled OCR task cleanup completed. Total duration: {total_duration:.1f}s")
 
 
 
 def parse_scheduled_time(time_str: str) -> Optional[time]:
     """
-    解析时间字符串 (格式: HH:MM) 为 time 对象
-    注意：python-telegram-bot 的调度器使用UTC时间，
-    但我们希望使用北京时间(UTC+8)来配置定时任务时间。
-    因此需要将北京时间转换为UTC时间。
+    解析时间字符串 (格式: HH:MM) 为带北京时区的 time 对象
+    python-telegram-bot 的调度器支持带时区的时间，会自行换算为UTC。
     """
     try:
         hour, minute = map(int, time_str.split(':'))
-        # 创建北京时间的时间对象
-        beijing_time = time(hour=hour, minute=minute)
-        
-        # 将北京时间转换为UTC时间
-        # 北京时间减8小时等于UTC时间
-        utc_hour = (hour - 8) % 24
-        utc_time = time(hour=utc_hour, minute=minute)
-        
-        logger.info(f"Scheduled time converted: Beijing {time_str} -> UTC {utc_time.strftime('%H:%M')}")
-        return utc_time
+        return time(hour=hour, minute=minute, tzinfo=BEIJING_TZ)
     except (ValueError, AttributeError):
         logger.error(f"Invalid time format: {time_str}. Expected HH:MM")
         return None
@@ -1881,6 +2421,7 @@ def signal_handler(signum, frame):
         frame: 当前栈帧
     """
     logger.info(f"收到信号 {signum}，正在关闭机器人...")
+    OCR_EXECUTOR.shutdown(wait=False, cancel_futures=True)
     sys.exit(0)
 
 
@@ -1898,14 +2439,15 @@ def create_application():
     from telegram.request import HTTPXRequest
     
     # 创建自定义请求对象，增大连接池和超时时间
-    # 关键修复：禁用HTTP/2以避免代理环境下的TLS握手错误
+    # HTTP 版本由配置决定：默认 HTTP/1.1 以避免代理环境下的TLS握手错误，
+    # 直连环境可配置为 "2"，在同一连接上复用并发请求
     request = HTTPXRequest(
         connection_pool_size=30,       # 增大连接池（默认1）
         read_timeout=45.0,             # 读取超时（秒）
         write_timeout=45.0,            # 写入超时（秒）
         connect_timeout=45.0,          # 连接超时（秒）
         pool_timeout=20.0,             # 连接池等待超时（秒）
-        http_version="1.1",            # 禁用HTTP/2，使用HTTP/1.1以提高代理兼容性
+        http_version=TELEGRAM_HTTP_VERSION,
     )
     
     app = (
@@ -1918,8 +2460,10 @@ def create_application():
             write_timeout=45.0,
             connect_timeout=45.0,
             pool_timeout=20.0,
-            http_version="1.1",        # 禁用HTTP/2，避免TLS握手错误
+            http_version=TELEGRAM_HTTP_VERSION,
         ))
+        .post_init(start_background_workers)
+        .post_shutdown(stop_background_workers)
         .build()
     )
     
@@ -1936,10 +2480,11 @@ def create_application():
     app.add_handler(CommandHandler('getocr', getocr_command))  # 查询OCR结果（新命令）
     app.add_handler(CommandHandler('failed', failed_command))  # 查询OCR失败记录（新命令）
     # handle_photo processes all photo messages, internal logic decides add or search
-    app.add_handler(MessageHandler(filters.PHOTO, handle_photo))
+    # block=False：连续转发的多张图片并发处理，下载并发数由 DOWNLOAD_SEM 限制
+    app.add_handler(MessageHandler(filters.PHOTO, handle_photo, block=False))
     
     # Add scheduled OCR task
-    # 注意：定时任务使用北京时间(UTC+8)配置，实际调度时间会自动转换为UTC
+    # 注意：定时任务使用北京时间(UTC+8)配置，调度器会根据时区自动换算
     scheduled_ocr_time = parse_scheduled_time(OCR_SCHEDULED_TIME)
     if scheduled_ocr_time:
         job_queue = app.job_queue
@@ -1951,7 +2496,7 @@ def create_application():
             name="daily_ocr_task"  # 给任务命名，防止重复注册
         )
         
-        logger.info(f"✅ Scheduled daily OCR task at Beijing time {OCR_SCHEDULED_TIME} (UTC {scheduled_ocr_time.strftime('%H:%M')})")
+        logger.info(f"✅ Scheduled daily OCR task at Beijing time {OCR_SCHEDULED_TIME} ({BEIJING_TZ})")
     else:
         logger.warning(f"Failed to parse OCR scheduled time: {OCR_SCHEDULED_TIME}")
     
@@ -1965,6 +2510,14 @@ if __name__ == '__main__':
     
     logger.info("Starting bot...")
     
+    # 可选：使用 uvloop 作为事件循环以提高网络并发性能，未安装（或 Windows）时使用默认事件循环
+    try:
+        import uvloop
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+        logger.info("Using uvloop event loop")
+    except ImportError:
+        pass
+    
     # 启动 Bot
     logger.info("🤖 机器人启动中...")
     